@@ -6,6 +6,8 @@ This module provides RESTful API endpoints for managing `Amenity` objects
 from flask import jsonify, abort, request
 from werkzeug.exceptions import BadRequest
 from api.v1.views import app_views
+from api.v1.views.pagination import paginate
+from api.v1.views.batch import create_batch, update_batch
 from models.amenity import Amenity
 from models import storage
 
@@ -25,9 +27,7 @@ def amenities():
         Response: JSON response with amenities data or success/error message.
     """
     if request.method == "GET":
-        amenities = storage.all(Amenity).values()
-        amenities_list = [amenity.to_dict() for amenity in amenities]
-        return jsonify(amenities_list)
+        return paginate(Amenity)
     elif request.method == "POST":
         try:
             req_data = request.get_json()
@@ -83,3 +83,15 @@ def amenity_obj(amenity_id):
             return (amenity.to_dict()), 200
         except BadRequest:
             abort(400, description="Not a JSON")
+
+
+@app_views.post("/amenities/batch", strict_slashes=False)
+@app_views.put("/amenities/batch", strict_slashes=False)
+def amenities_batch():
+    """
+    Creates (POST) or updates (PUT) a JSON array of Amenity objects
+    with a single storage write.
+    """
+    if request.method == "POST":
+        return create_batch(Amenity, ["name"])
+    return update_batch(Amenity, ["id", "created_at", "updated_at"])
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""
+This module handles the batch endpoints of the collections, which
+create or update a whole JSON array of objects with a single storage
+write instead of one per object.
+"""
+from flask import abort, jsonify, request
+from models import storage
+from models.user import User
+from werkzeug.exceptions import BadRequest
+
+
+def read_batch():
+    """
+    Returns the JSON array of objects of the request body.
+    Aborts with 400 when the body is not an array of JSON objects.
+    """
+    try:
+        items = request.get_json()
+    except BadRequest:
+        abort(400, description="Not a JSON")
+    if not isinstance(items, list) or \
+            not all(isinstance(item, dict) for item in items):
+        abort(400, description="Not a JSON array of objects")
+    return items
+
+
+def create_batch(cls, required, fk=None, value=None):
+    """
+    Creates a cls object from every item of the request array, saved
+    with storage.bulk_new().
+
+    Every item must hold the required fields, and the user_id of an
+    item, when required, must be an existing User. Nothing is created
+    when an item is rejected.
+
+    Args:
+        cls: The model class of the collection.
+        required (list): The fields every item must hold.
+        fk (str): Optional foreign key set on every object.
+        value (str): The value of fk, taken from the URL.
+
+    Returns:
+        Response: JSON list of the created objects, 201 status code.
+    """
+    items = read_batch()
+    users = set()
+    for i, item in enumerate(items):
+        for field in required:
+            if field not in item:
+                abort(400, description=f"Missing {field} in item {i}")
+        if "user_id" in required and item["user_id"] not in users:
+            if storage.get(User, item["user_id"]) is None:
+                abort(404)
+            users.add(item["user_id"])
+    objs = []
+    for item in items:
+        obj = cls(**item)
+        if fk is not None:
+            setattr(obj, fk, value)
+        objs.append(obj)
+    storage.bulk_new(objs)
+    return jsonify([obj.to_dict() for obj in objs]), 201
+
+
+def update_batch(cls, ignore):
+    """
+    Updates the cls objects named by the id of every item of the
+    request array with the other fields of the item, with
+    storage.bulk_update(). Unknown ids are skipped.
+
+    Args:
+        cls: The model class of the collection.
+        ignore (list): The fields that cannot be updated.
+
+    Returns:
+        Response: JSON object with the number of updated objects.
+    """
+    items = read_batch()
+    for i, item in enumerate(items):
+        if "id" not in item:
+            abort(400, description=f"Missing id in item {i}")
+    rows = [{k: v for k, v in item.items() if k == "id" or k not in ignore}
+            for item in items]
+    return jsonify({"updated": storage.bulk_update(cls, rows)}), 200
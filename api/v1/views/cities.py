@@ -9,6 +9,8 @@ from api.v1.views import app_views
 from models import storage
 from models.city import City
 from models.state import State
+from api.v1.views.pagination import paginate
+from api.v1.views.batch import create_batch, update_batch
 from flask import jsonify, abort, request
 from werkzeug.exceptions import BadRequest
 
@@ -33,9 +35,7 @@ def state_cities(state_id):
     if state is None:
         abort(404)
     if request.method == "GET":
-        cities = storage.all(City).values()
-        st_ctz = [c.to_dict() for c in cities if c.state_id == state_id]
-        return jsonify(st_ctz)
+        return paginate(City, "state_id", state_id)
     elif request.method == "POST":
         try:
             req_data = request.get_json()
@@ -91,3 +91,22 @@ def cities(city_id):
             return jsonify(city.to_dict()), 200
         except BadRequest:
             abort(400, description="Not a JSON")
+
+
+@app_views.post("/states/<state_id>/cities/batch", strict_slashes=False)
+def state_cities_batch(state_id):
+    """
+    Creates a JSON array of City objects linked to the specified state
+    with a single storage write.
+    """
+    if storage.get(State, state_id) is None:
+        abort(404)
+    return create_batch(City, ["name"], "state_id", state_id)
+
+
+@app_views.put("/cities/batch", strict_slashes=False)
+def cities_batch():
+    """
+    Updates a JSON array of City objects with a single storage write.
+    """
+    return update_batch(City, ["id", "state_id", "created_at", "updated_at"])
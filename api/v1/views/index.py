@@ -44,3 +44,14 @@ def stats():
     for k, v in objs.items():
         obj_dict[k] = storage.count(v)
     return jsonify(obj_dict)
+
+
+@app_views.route("/metrics")
+def metrics():
+    """
+    Retrieves the counters of the storage engine.
+    In write-behind mode, unflushed_seconds is the age of the oldest
+    change not on disk yet and loss_window_seconds its upper bound.
+    """
+    from models import storage
+    return jsonify(storage.metrics())
@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+"""
+This module builds the JSON responses of the collection endpoints,
+one keyset page at a time when the client asks for it, filtered and
+sorted by storage from the query parameters.
+"""
+from datetime import datetime
+from flask import (Response, abort, current_app, jsonify, request,
+                   stream_with_context)
+from models import storage
+from models.base_model import format_time, parse_time
+from urllib.parse import urlencode
+
+"""Number of objects fetched from storage per streamed chunk"""
+STREAM_BATCH = 500
+
+
+def paginate(cls, fk=None, value=None):
+    """
+    Returns the JSON list of cls objects for a collection GET request.
+
+    Without query parameters every object is returned, streamed as it
+    is encoded (see stream()). With `limit` (and optionally `after`, the
+    last id of the previous page) only the next `limit` objects in id
+    order are returned, and a `Link` header with rel="next" points at
+    the following page when there is one.
+
+    `sort=created_at` pages the same way in (created_at, id) order, the
+    cursor `after` being `<created_at>,<id>` of the last object.
+
+    Any other `field=value` parameter keeps the objects whose field
+    equals value (see filters()). Any other `sort=field` (`-field`
+    descending, several fields separated by commas) lists them in that
+    order instead, the first `limit` objects only when `limit` is given;
+    `after` cannot be used with such a `sort`.
+
+    Args:
+        cls: The model class listed by the endpoint.
+        fk (str): Optional foreign key restricting the listing.
+        value (str): The value fk must have.
+
+    Returns:
+        Response: JSON list of the objects as dictionaries.
+    """
+    limit = request.args.get("limit")
+    after = request.args.get("after")
+    sort = request.args.get("sort")
+    where = filters(cls)
+    by = "id"
+    if sort in ("id", "created_at"):
+        by, sort = sort, None
+    if sort is not None:
+        if after is not None:
+            abort(400, description="after cannot be used with sort")
+        order_by = sort.split(",")
+        for field in order_by:
+            if field_type(cls, field.lstrip("-")) is None:
+                abort(400, description=f"Invalid sort field {field}")
+        if fk is not None:
+            where[fk] = value
+        if limit is not None:
+            limit = parse_limit(limit)
+        objs = storage.all(cls, where=where, order_by=order_by, limit=limit)
+        return jsonify([obj.to_dict() for obj in objs.values()])
+    if limit is None and after is None:
+        return stream(cls, fk, value, where, by)
+    limit = parse_limit(limit) if limit is not None else 100
+    if after is not None and by == "created_at":
+        after = parse_cursor(after)
+    objs = list(storage.page(cls, limit + 1, after, fk, value,
+                             where, by).values())
+    response = jsonify([obj.to_dict() for obj in objs[:limit]])
+    if len(objs) > limit:
+        args = request.args.to_dict()
+        args["limit"] = limit
+        last = objs[limit - 1]
+        args["after"] = last.id if by == "id" else \
+            format_time(last.created_at) + "," + last.id
+        link = request.base_url + "?" + urlencode(args)
+        response.headers["Link"] = '<{}>; rel="next"'.format(link)
+    return response
+
+
+def parse_limit(limit):
+    """returns the positive integer of the limit parameter, aborts with
+    400 when it is not one"""
+    try:
+        limit = int(limit)
+    except ValueError:
+        abort(400, description="Invalid limit")
+    if limit < 1:
+        abort(400, description="Invalid limit")
+    return limit
+
+
+def parse_cursor(after):
+    """returns the (created_at, id) pair of the after parameter of a
+    created_at page, aborts with 400 when it is not one"""
+    created_at, comma, id = after.partition(",")
+    try:
+        return parse_time(created_at), id
+    except ValueError:
+        abort(400, description="Invalid after")
+
+
+def field_type(cls, field):
+    """
+    Returns the type of the values of the stored attribute field of cls
+    objects, or None when cls objects store no such attribute.
+    """
+    if field == "id":
+        return str
+    if field in ("created_at", "updated_at"):
+        return datetime
+    table = getattr(cls, "__table__", None)
+    if table is not None:
+        column = table.columns.get(field)
+        return None if column is None else column.type.python_type
+    if field.startswith("_"):
+        return None
+    # compact models keep their defaults in _defaults, not on the class
+    default = getattr(cls, "_defaults", {}).get(field, getattr(cls, field,
+                                                               None))
+    if default is None:
+        return None
+    if callable(default) or isinstance(default, (property, list)):
+        return None
+    return type(default)
+
+
+def filters(cls):
+    """
+    Returns the dictionary field -> value of the query parameters of
+    the request other than limit, after and sort, each value converted
+    to the type of its field. Aborts with 400 on a field cls objects do
+    not store or a value of the wrong type.
+    """
+    where = {}
+    for field, text in request.args.items():
+        if field in ("limit", "after", "sort"):
+            continue
+        kind = field_type(cls, field)
+        if kind is None:
+            abort(400, description=f"Invalid filter {field}")
+        try:
+            where[field] = parse_time(text) if kind is datetime else \
+                kind(text)
+        except ValueError:
+            abort(400, description=f"Invalid value for {field}")
+    return where
+
+
+def stream(cls, fk=None, value=None, where=None, by="id"):
+    """
+    Returns a streamed JSON list of every cls object.
+
+    The list is encoded from keyset pages of STREAM_BATCH objects, so the
+    first bytes go out right away and only one page is held in memory.
+    Each object is encoded by the JSON provider of the app with compact
+    separators, so the body is the one jsonify() returns outside debug
+    mode.
+
+    Args:
+        cls: The model class listed by the endpoint.
+        fk (str): Optional foreign key restricting the listing.
+        value (str): The value fk must have.
+        where (dict): Optional values other attributes must have.
+        by (str): "id" or "created_at", the order of the objects.
+
+    Returns:
+        Response: chunked JSON list of the objects as dictionaries.
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        """yields the JSON list one page of objects at a time"""
+        yield "["
+        after = None
+        while True:
+            objs = list(storage.page(cls, STREAM_BATCH, after,
+                                     fk, value, where, by).values())
+            if objs:
+                chunk = ",".join(dumps(obj.to_dict(), separators=(",", ":"))
+                                 for obj in objs)
+                yield chunk if after is None else "," + chunk
+            if len(objs) < STREAM_BATCH:
+                break
+            after = objs[-1].id if by == "id" else \
+                (objs[-1].created_at, objs[-1].id)
+        yield "]\n"
+    return Response(stream_with_context(generate()),
+                    mimetype="application/json")
@@ -9,7 +9,10 @@ from models.place import Place
 from models.city import City
 from models.user import User
 from models import storage
+from api.v1.views.pagination import paginate, parse_limit
+from api.v1.views.batch import create_batch, update_batch
 from flask import request, abort, jsonify
+from math import isfinite
 from werkzeug.exceptions import BadRequest
 
 
@@ -33,9 +36,7 @@ def city_places(city_id):
     if city is None:
         abort(404)
     if request.method == "GET":
-        places = storage.all(Place).values()
-        p = [place.to_dict() for place in places if place.city_id == city.id]
-        return jsonify(p)
+        return paginate(Place, "city_id", city.id)
     elif request.method == "POST":
         try:
             req_data = request.get_json()
@@ -98,3 +99,113 @@ def place_obj(place_id):
                 setattr(place, k, v)
         storage.save()
         return jsonify(place.to_dict()), 200
+
+
+@app_views.post("/cities/<city_id>/places/batch", strict_slashes=False)
+def city_places_batch(city_id):
+    """
+    Creates a JSON array of Place objects in the specified city with a
+    single storage write.
+    """
+    if storage.get(City, city_id) is None:
+        abort(404)
+    return create_batch(Place, ["user_id", "name"], "city_id", city_id)
+
+
+@app_views.put("/places/batch", strict_slashes=False)
+def places_batch():
+    """
+    Updates a JSON array of Place objects with a single storage write.
+    """
+    return update_batch(Place, ["id", "user_id", "city_id", "created_at",
+                                "updated_at"])
+
+
+@app_views.post("/places_search", strict_slashes=False)
+def places_search():
+    """
+    Endpoint to search places.
+
+    The JSON body may hold lists of ids under `states`, `cities` and
+    `amenities`. The places returned are those in the cities of the
+    states or in the cities listed, every place when both lists are
+    empty, that offer every amenity listed.
+
+    Returns:
+        Response: JSON list of the matching places.
+    """
+    try:
+        req_data = request.get_json()
+    except BadRequest:
+        abort(400, description="Not a JSON")
+    if not isinstance(req_data, dict):
+        abort(400, description="Not a JSON")
+    filters = {}
+    for k in ("states", "cities", "amenities"):
+        ids = req_data.get(k) or []
+        if not isinstance(ids, list) or \
+                not all(isinstance(id, str) for id in ids):
+            abort(400, description=f"{k} is not a list of ids")
+        filters[k] = ids
+    places = storage.search_places(**filters).values()
+    return jsonify([place.to_dict() for place in places])
+
+
+@app_views.get("/places/near", strict_slashes=False)
+def places_near():
+    """
+    Endpoint to find places by location.
+
+    Query parameters:
+        lat, lng: The point the distances are measured from.
+        radius: Keeps the places within radius km of the point.
+        south, west, north, east: Keeps the places in that bounding box
+        (west > east crosses the antimeridian); lat and lng default to
+        its center.
+        limit: Returns the nearest limit places only.
+
+    Returns:
+        Response: JSON list of the places, nearest first, each with its
+        `distance` in km.
+    """
+    args = {}
+    for k in ("lat", "lng", "radius", "south", "west", "north", "east"):
+        if k in request.args:
+            try:
+                args[k] = float(request.args[k])
+            except ValueError:
+                abort(400, description=f"Invalid {k}")
+            if not isfinite(args[k]):
+                abort(400, description=f"Invalid {k}")
+    box = None
+    sides = [args.get(k) for k in ("south", "west", "north", "east")]
+    if any(side is not None for side in sides):
+        if any(side is None for side in sides):
+            abort(400, description="Missing side of the box")
+        if not all(-90 <= side <= 90 for side in sides[::2]) or \
+                not all(-180 <= side <= 180 for side in sides[1::2]):
+            abort(400, description="Invalid box")
+        box = tuple(sides)
+        args.setdefault("lat", (box[0] + box[2]) / 2)
+        if "lng" not in args:
+            east = box[3] if box[1] <= box[3] else box[3] + 360
+            args["lng"] = ((box[1] + east) / 2 + 180) % 360 - 180
+    for k in ("lat", "lng"):
+        if k not in args:
+            abort(400, description=f"Missing {k}")
+    if "radius" not in args and box is None:
+        abort(400, description="Missing radius")
+    if not -90 <= args["lat"] <= 90 or not -180 <= args["lng"] <= 180 or \
+            args.get("radius", 0) < 0 or (box and box[0] > box[2]):
+        abort(400, description="Invalid location")
+    limit = request.args.get("limit")
+    if limit is not None:
+        limit = parse_limit(limit)
+    found = storage.places_near(args["lat"], args["lng"],
+                                args.get("radius"), box, limit)
+    places = []
+    for place, distance in found:
+        place_dict = place.to_dict()
+        place_dict["distance"] = distance
+        places.append(place_dict)
+    return jsonify(places)
@@ -15,7 +15,7 @@ from models import storage, storage_t
 @app_views.post("/places/<place_id>/amenities/<amenity_id>", strict_slashes=False)
 def place_amenities(place_id=None, amenity_id=None):
     if storage_t == "db":
-        place_obj = storage.get(Place, place_id)
+        place_obj = storage.get(Place, place_id, eager=["amenities"])
         amenity_obj = storage.get(Amenity, amenity_id)
         if place_obj is None:
             abort(404)
@@ -28,7 +28,7 @@ def place_amenities(place_id=None, amenity_id=None):
                 abort(404)
             if amenity_obj not in place_amenities:
                 abort(404)
-            storage.delete(amenity_obj)
+            place_amenities.remove(amenity_obj)
             storage.save()
             return ({}), 200
         elif request.method == "POST":
@@ -38,23 +38,25 @@ def place_amenities(place_id=None, amenity_id=None):
                 return jsonify(amenity_obj.to_dict()), 200
             place_amenities.append(amenity_obj)
             storage.save()
-            return jsonify(amenity_obj), 201
+            return jsonify(amenity_obj.to_dict()), 201
     else:
         place_obj = storage.get(Place, place_id)
         amenity_obj = storage.get(Amenity, amenity_id)
-        place_amenities = place_obj.amenities
         if place_obj is None:
             abort(404)
+        place_amenities = place_obj.amenities
+        # amenity_ids is assigned, not changed in place, so that the
+        # amenity -> places index of storage follows
         if request.method == "GET":
-            place_amids = []
-        am_list = [amenity.to_dict() for amenity in place_amenities]
-        return jsonify(am_list)
+            am_list = [amenity.to_dict() for amenity in place_amenities]
+            return jsonify(am_list)
         elif request.method == "DELETE":
             if amenity_obj is None:
                 abort(404)
             if amenity_obj not in place_amenities:
                 abort(404)
-            storage.delete(amenity_obj)
+            place_obj.amenity_ids = [id for id in place_obj.amenity_ids
+                                     if id != amenity_id]
             storage.save()
             return ({}), 200
         elif request.method == "POST":
@@ -62,6 +64,6 @@ def place_amenities(place_id=None, amenity_id=None):
                 abort(404)
             if amenity_obj in place_amenities:
                 return jsonify(amenity_obj.to_dict()), 200
-            place_amenities.append(amenity_obj)
+            place_obj.amenity_ids = place_obj.amenity_ids + [amenity_id]
             storage.save()
-            return jsonify(amenity_obj), 201
+            return jsonify(amenity_obj.to_dict()), 201
@@ -6,6 +6,8 @@ It includes routes to create, retrieve, update, and delete users
 from flask import request, abort, jsonify
 from werkzeug.exceptions import BadRequest
 from api.v1.views import app_views
+from api.v1.views.pagination import paginate
+from api.v1.views.batch import create_batch, update_batch
 from models.place import Place
 from models.review import Review
 from models import storage
@@ -31,9 +33,7 @@ def places_reviews(place_id):
     if place is None:
         abort(404)
     if request.method == "GET":
-        reviews = place.reviews
-        place_reviews = [rev.to_dict() for rev in reviews]
-        return jsonify(place_reviews)
+        return paginate(Review, "place_id", place_id)
     elif request.method == "POST":
         try:
             req_data = request.get_json()
@@ -96,4 +96,23 @@ def reviews(review_id):
                 setattr(review, k, v)
         storage.save()
         return jsonify(review.to_dict()), 200
-    
\ No newline at end of file
+
+
+@app_views.post("/places/<place_id>/reviews/batch", strict_slashes=False)
+def places_reviews_batch(place_id):
+    """
+    Creates a JSON array of Review objects for the specified place with
+    a single storage write.
+    """
+    if storage.get(Place, place_id) is None:
+        abort(404)
+    return create_batch(Review, ["user_id", "text"], "place_id", place_id)
+
+
+@app_views.put("/reviews/batch", strict_slashes=False)
+def reviews_batch():
+    """
+    Updates a JSON array of Review objects with a single storage write.
+    """
+    return update_batch(Review, ["id", "user_id", "place_id", "created_at",
+                                 "updated_at"])
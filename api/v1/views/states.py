@@ -6,6 +6,8 @@ This module defines the routes for managing State objects in the REST API.
 from api.v1.views import app_views
 from models import storage
 from models.state import State
+from api.v1.views.pagination import paginate
+from api.v1.views.batch import create_batch, update_batch
 from flask import jsonify, abort, request
 from werkzeug.exceptions import BadRequest
 
@@ -49,9 +51,7 @@ def states(state_id=None):
     """
     if state_id is None:
         if request.method == "GET":
-            states = storage.all(State).values()
-            state_list = [state.to_dict() for state in states]
-            return jsonify(state_list)
+            return paginate(State)
         elif request.method == "POST":
             try:
                 data = request.get_json()
@@ -90,3 +90,15 @@ def states(state_id=None):
                 return jsonify(state.to_dict()), 200
             except BadRequest:
                 abort(400, description="Not a JSON")
+
+
+@app_views.post("/states/batch", strict_slashes=False)
+@app_views.put("/states/batch", strict_slashes=False)
+def states_batch():
+    """
+    Creates (POST) or updates (PUT) a JSON array of State objects
+    with a single storage write.
+    """
+    if request.method == "POST":
+        return create_batch(State, ["name"])
+    return update_batch(State, ["id", "created_at", "updated_at"])
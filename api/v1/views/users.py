@@ -4,6 +4,8 @@ This module provides RESTful API endpoints for managing `User` objects
 It includes routes to create, retrieve, update, and delete users
 """
 from api.v1.views import app_views
+from api.v1.views.pagination import paginate
+from api.v1.views.batch import create_batch, update_batch
 from models.user import User
 from models import storage
 from flask import request, abort, jsonify
@@ -25,11 +27,7 @@ def users():
         Response: JSON response with users data or success/error message.
     """
     if request.method == "GET":
-        all_users = storage.all(User).values()
-        list_users = []
-        for user in all_users:
-            list_users.append(user.to_dict())
-        return jsonify(list_users)
+        return paginate(User)
     elif request.method == "POST":
         try:
             req_data = request.get_json()
@@ -87,3 +85,15 @@ def user_objs(user_id):
                 setattr(user, k, v)
         storage.save()
         return jsonify(user.to_dict()), 200
+
+
+@app_views.post("/users/batch", strict_slashes=False)
+@app_views.put("/users/batch", strict_slashes=False)
+def users_batch():
+    """
+    Creates (POST) or updates (PUT) a JSON array of User objects
+    with a single storage write.
+    """
+    if request.method == "POST":
+        return create_batch(User, ["email", "password"])
+    return update_batch(User, ["id", "email", "created_at", "updated_at"])
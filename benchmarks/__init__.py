@@ -0,0 +1,5 @@
+#!/usr/bin/python3
+"""
+Benchmarks for the storage engines and the RESTful API.
+Each module is runnable with `python3 -m benchmarks.<module> --help`.
+"""
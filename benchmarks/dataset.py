@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+"""
+Generates synthetic States, Cities, Users, Amenities, Places and Reviews
+for the benchmarks. The models package must be imported by the caller
+with the storage type under test already selected.
+"""
+import random
+
+
+def generate(scale, seed=0):
+    """
+    Returns a list of about `scale` new, unsaved objects, parents first.
+
+    The mix is 1% States, 5% Cities, 10% Users, 24% Places and 60%
+    Reviews, plus up to 50 Amenities linked to the Places three at a time.
+    The same scale and seed always give the same layout.
+    """
+    from models import storage_t
+    from models.amenity import Amenity
+    from models.city import City
+    from models.place import Place
+    from models.review import Review
+    from models.state import State
+    from models.user import User
+
+    rand = random.Random(seed)
+    states = [State(name="State {}".format(i))
+              for i in range(max(1, scale // 100))]
+    cities = [City(name="City {}".format(i), state_id=rand.choice(states).id)
+              for i in range(max(1, scale * 5 // 100))]
+    users = [User(email="user{}@hbnb.io".format(i), password="pwd",
+                  first_name="First", last_name="Last")
+             for i in range(max(1, scale // 10))]
+    amenities = [Amenity(name="Amenity {}".format(i))
+                 for i in range(min(50, max(3, scale // 100)))]
+    places = []
+    for i in range(max(1, scale * 24 // 100)):
+        place = Place(name="Place {}".format(i),
+                      city_id=rand.choice(cities).id,
+                      user_id=rand.choice(users).id,
+                      number_rooms=rand.randint(1, 6),
+                      price_by_night=rand.randint(20, 500),
+                      latitude=rand.uniform(-60.0, 70.0),
+                      longitude=rand.uniform(-180.0, 180.0))
+        linked = rand.sample(amenities, 3)
+        if storage_t == "db":
+            place.amenities = linked
+        else:
+            place.amenity_ids = [amenity.id for amenity in linked]
+        places.append(place)
+    reviews = [Review(text="Review {}".format(i),
+                      place_id=rand.choice(places).id,
+                      user_id=rand.choice(users).id)
+               for i in range(max(1, scale * 60 // 100))]
+    return states + cities + users + amenities + places + reviews
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+"""
+Times the location queries of storage.places_near() against a scan of
+every Place, on places spread over the inhabited latitudes.
+
+    python3 -m benchmarks.geo --engine file,db --places 1000000 \
+        --queries 50 [--output geo.jsonl]
+
+Every engine runs in its own process, inside a temporary directory; the
+DB engine runs against a SQLite file through HBNB_DB_URL. For each
+search (radius or bounding box) one JSON line is printed with the
+average seconds per query through the index and through the scan, the
+average number of places found and the speedup.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+"""(name, radius in km, side of the bounding box in degrees) searched"""
+SEARCHES = [("radius 1 km", 1, None), ("radius 10 km", 10, None),
+            ("radius 100 km", 100, None), ("box 0.5 deg", None, 0.5),
+            ("box 5 deg", None, 5)]
+
+
+def run(places, queries, seed):
+    """loads places places into the storage engine selected by
+    HBNB_TYPE_STORAGE and returns the list of measurements"""
+    from models import storage
+    from models.engine import geo
+    from models.place import Place
+
+    rand = random.Random(seed)
+    start = perf_counter()
+    objs = [Place(name="Place {}".format(i), city_id="city",
+                  user_id="user", latitude=rand.uniform(-60.0, 70.0),
+                  longitude=rand.uniform(-180.0, 180.0))
+            for i in range(places)]
+    storage.bulk_new(objs)
+    results = [{"op": "load", "places": places,
+                "seconds": perf_counter() - start}]
+    points = [(rand.uniform(-60.0, 70.0), rand.uniform(-180.0, 180.0))
+              for i in range(queries)]
+    everything = list(storage.all(Place).values())
+    for name, radius, side in SEARCHES:
+        boxes = [None if side is None else
+                 (lat - side / 2, (lng - side / 2 + 180) % 360 - 180,
+                  lat + side / 2, (lng + side / 2 + 180) % 360 - 180)
+                 for lat, lng in points]
+        start = perf_counter()
+        found = [storage.places_near(lat, lng, radius, box)
+                 for (lat, lng), box in zip(points, boxes)]
+        indexed = (perf_counter() - start) / queries
+        start = perf_counter()
+        scanned = [geo.nearest(lat, lng, everything, radius, box)
+                   for (lat, lng), box in zip(points, boxes)]
+        scan = (perf_counter() - start) / queries
+        if [len(f) for f in found] != [len(s) for s in scanned]:
+            raise AssertionError(name + ": index and scan disagree")
+        results.append({"op": name, "places": places,
+                        "found": sum(len(f) for f in found) / queries,
+                        "index_seconds": indexed, "scan_seconds": scan,
+                        "speedup": scan / indexed if indexed else None})
+    return results
+
+
+def main():
+    """parses the command line and runs one child process per engine"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--engine", default="file,db",
+                        help="comma separated engines: file, db")
+    parser.add_argument("--places", type=int, default=1000000,
+                        help="number of places")
+    parser.add_argument("--queries", type=int, default=50,
+                        help="queries timed per search")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON lines file to write")
+    parser.add_argument("--child", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        for r in run(args.places, args.queries, args.seed):
+            print(json.dumps(r))
+        return
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for engine in args.engine.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, PYTHONPATH=root)
+            env.pop("HBNB_TYPE_STORAGE", None)
+            if engine == "db":
+                env["HBNB_TYPE_STORAGE"] = "db"
+                env["HBNB_DB_URL"] = "sqlite:///" + os.path.join(tmp,
+                                                                 "geo.db")
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.geo", "--child",
+                 "--places", str(args.places), "--queries",
+                 str(args.queries), "--seed", str(args.seed)],
+                cwd=tmp, env=env, check=True, stdout=subprocess.PIPE,
+                universal_newlines=True).stdout
+        for line in out.splitlines():
+            r = json.loads(line)
+            r.update(engine=engine)
+            results.append(r)
+            print(json.dumps(r), flush=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            for r in results:
+                f.write(json.dumps(r) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+"""
+Measures the memory held per object by FileStorage, with the regular
+models and with the compact ones (HBNB_FILE_COMPACT=1), which also drop
+the cache of encoded records unless HBNB_FILE_ENCODE_CACHE=1 (mode
+compact-cached), so that both savings show apart.
+
+    python3 -m benchmarks.memory --scale 100000 [--output mem.jsonl]
+
+Each mode runs in its own process. The objects are generated, added to
+storage and saved once, so every instance has been serialized like in
+a running API worker; the bytes still allocated are then divided by the
+number of objects. One JSON line is printed per mode and class.
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+
+def shallow_size(obj):
+    """returns the bytes of obj itself plus its attribute dictionary"""
+    size = sys.getsizeof(obj)
+    if not hasattr(type(obj), "_fields"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def run(scale, seed):
+    """returns the bytes per object of the current mode: in total, with
+    attribute values, storage indexes and caches, then per class for
+    the instances alone"""
+    tracemalloc.start()
+    from benchmarks.dataset import generate
+    from models import storage
+
+    gc.collect()
+    before = tracemalloc.take_snapshot()
+    for obj in generate(scale, seed):
+        storage.new(obj)
+    storage.save()
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    total = sum(stat.size_diff for stat in
+                after.compare_to(before, "filename"))
+    objs = storage.all()
+    results = [{"class": "all", "objects": len(objs),
+                "bytes_per_object": total / len(objs)}]
+    by_class = {}
+    for obj in objs.values():
+        by_class.setdefault(obj.__class__.__name__, []).append(obj)
+    for name, instances in sorted(by_class.items()):
+        size = sum(shallow_size(obj) for obj in instances)
+        results.append({"class": name, "objects": len(instances),
+                        "bytes_per_object": size / len(instances)})
+    return results
+
+
+def main():
+    """parses the command line and runs one child process per mode"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--scale", default="100000",
+                        help="number of objects")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON lines file to write")
+    parser.add_argument("--child", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        for r in run(int(args.scale), args.seed):
+            print(json.dumps(r))
+        return
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for mode in ("regular", "compact", "compact-cached"):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, PYTHONPATH=root)
+            env.pop("HBNB_TYPE_STORAGE", None)
+            env.pop("HBNB_FILE_COMPACT", None)
+            env.pop("HBNB_FILE_ENCODE_CACHE", None)
+            if mode != "regular":
+                env["HBNB_FILE_COMPACT"] = "1"
+            if mode == "compact-cached":
+                env["HBNB_FILE_ENCODE_CACHE"] = "1"
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.memory", "--child",
+                 "--scale", args.scale, "--seed", str(args.seed)],
+                cwd=tmp, env=env, check=True, stdout=subprocess.PIPE,
+                universal_newlines=True).stdout
+        for line in out.splitlines():
+            r = json.loads(line)
+            r.update(mode=mode, scale=int(args.scale))
+            results.append(r)
+            print(json.dumps(r), flush=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            for r in results:
+                f.write(json.dumps(r) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+"""
+Load test of the DBStorage connection pool: API requests served by
+several threads at once against a SQLite file standing in for MySQL.
+
+    python3 -m benchmarks.pool --threads 1,4,16 --pool-size 1,5 \
+        --requests 200 [--output pool.jsonl]
+
+Every (threads, pool size) pair runs in its own process with
+HBNB_MYSQL_POOL_SIZE set, so the engine is created with that pool. Each
+thread sends GET requests through the Flask test client, whose teardown
+returns the connection to the pool like a real worker does. One JSON line
+is printed per run with the requests per second and the pool counters of
+DBStorage.metrics(): connections checked out, overflow, wait time.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from time import perf_counter
+
+
+def run(threads, requests, scale, seed):
+    """serves requests GET requests from each of threads threads and
+    returns the measurement"""
+    from benchmarks.dataset import generate
+    from models import storage
+    from models.state import State
+    from api.v1.app import app
+
+    objs = generate(scale, seed)
+    for obj in objs:
+        storage.new(obj)
+    storage.save()
+    state_ids = [obj.id for obj in objs if isinstance(obj, State)]
+    storage.close()
+    routes = ["/api/v1/states/" + state_ids[i % len(state_ids)]
+              for i in range(requests)]
+    routes[::10] = ["/api/v1/stats"] * len(routes[::10])
+    errors = []
+
+    def work():
+        """sends the requests of one thread"""
+        client = app.test_client()
+        for route in routes:
+            if client.get(route).status_code != 200:
+                errors.append(route)
+    workers = [threading.Thread(target=work) for i in range(threads)]
+    start = perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = perf_counter() - start
+    total = threads * requests
+    return {"threads": threads, "requests": total, "errors": len(errors),
+            "seconds": seconds, "requests_per_s": total / seconds,
+            "pool": storage.metrics()["pool"]}
+
+
+def main():
+    """parses the command line and runs one child process per number of
+    threads and pool size"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--threads", default="1,4,16",
+                        help="comma separated numbers of threads")
+    parser.add_argument("--pool-size", default="5",
+                        help="comma separated HBNB_MYSQL_POOL_SIZE values")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="requests sent by each thread")
+    parser.add_argument("--scale", type=int, default=1000,
+                        help="number of objects in the database")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON lines file to write")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run(args.child, args.requests, args.scale,
+                             args.seed)))
+        return
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for size in args.pool_size.split(","):
+        for threads in args.threads.split(","):
+            with tempfile.TemporaryDirectory() as tmp:
+                env = dict(os.environ, PYTHONPATH=root,
+                           HBNB_TYPE_STORAGE="db",
+                           HBNB_MYSQL_POOL_SIZE=size,
+                           HBNB_DB_URL="sqlite:///" + os.path.join(
+                               tmp, "pool.db"))
+                out = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.pool", "--child",
+                     threads, "--requests", str(args.requests),
+                     "--scale", str(args.scale), "--seed", str(args.seed)],
+                    cwd=tmp, env=env, check=True, stdout=subprocess.PIPE,
+                    universal_newlines=True).stdout
+            r = json.loads(out.splitlines()[-1])
+            r.update(pool_size=int(size))
+            results.append(r)
+            print(json.dumps(r), flush=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            for r in results:
+                f.write(json.dumps(r) + "\n")
+
+
+if __name__ == "__main__":
+    main()
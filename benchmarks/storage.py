@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+"""
+Times the storage primitives and the main API routes at several scales.
+
+    python3 -m benchmarks.storage --engine file,db --scale 1000,10000 \
+        --output run.jsonl [--compare previous.jsonl]
+
+Every (engine, scale) pair runs in its own process, inside a temporary
+directory, so file.json and the models package start out fresh. The DB
+engine runs against a SQLite file through HBNB_DB_URL, no MySQL needed.
+Results are written as JSON lines: one object per measurement with the
+engine, scale, operation, number of calls and total seconds.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+
+def timed(results, op, n, func):
+    """runs func once, records it as n calls of op and returns its value"""
+    start = perf_counter()
+    value = func()
+    seconds = perf_counter() - start
+    results.append({"op": op, "n": n, "seconds": seconds,
+                    "per_op_us": seconds / max(n, 1) * 1e6})
+    return value
+
+
+def run(scale, ops, seed):
+    """benchmarks the storage engine selected by HBNB_TYPE_STORAGE and
+    returns the list of measurements"""
+    from benchmarks.dataset import generate
+    from models import storage
+    from models.amenity import Amenity
+    from models.city import City
+    from models.place import Place
+    from models.review import Review
+    from models.state import State
+    from models.user import User
+
+    rand = random.Random(seed)
+    results = []
+    objs = generate(scale, seed)
+    by_class = {}
+    for obj in objs:
+        by_class.setdefault(obj.__class__, []).append(obj.id)
+
+    def new_all():
+        for obj in objs:
+            storage.new(obj)
+    timed(results, "new", len(objs), new_all)
+    timed(results, "save", 1, storage.save)
+
+    def update_one():
+        obj = storage.get(State, rand.choice(by_class[State]))
+        obj.name = "renamed"
+        storage.save()
+    timed(results, "update+save", 1, update_one)
+
+    samples = [(cls, rand.choice(ids)) for cls, ids in by_class.items()
+               for i in range(ops // len(by_class))]
+    timed(results, "get", len(samples),
+          lambda: [storage.get(cls, id) for cls, id in samples])
+    timed(results, "get_missing", ops,
+          lambda: [storage.get(Review, "missing") for i in range(ops)])
+    for cls in (State, Place, Review):
+        timed(results, "all({})".format(cls.__name__), 5,
+              lambda: [storage.all(cls) for i in range(5)])
+    classes = (Amenity, City, Place, Review, State, User)
+    timed(results, "count(cls)", len(classes) * 10,
+          lambda: [storage.count(cls) for cls in classes for i in range(10)])
+    timed(results, "count()", 10, lambda: [storage.count() for i in range(10)])
+
+    def reload():
+        storage.close()
+        if os.getenv("HBNB_TYPE_STORAGE") != "db":
+            storage.all().clear()
+        storage.reload()
+    timed(results, "reload", 1, reload)
+    timed(results, "close", 10, lambda: [storage.close() for i in range(10)])
+
+    from api.v1.app import app
+    client = app.test_client()
+    state_id = rand.choice(by_class[State])
+    city_id = rand.choice(by_class[City])
+    place_id = rand.choice(by_class[Place])
+    review_id = rand.choice(by_class[Review])
+    routes = [("/stats", "/stats"),
+              ("/states", "/states"),
+              ("/states?limit=100", "/states?limit=100"),
+              ("/states/<id>", "/states/" + state_id),
+              ("/states/<id>/cities", "/states/{}/cities".format(state_id)),
+              ("/cities/<id>/places", "/cities/{}/places".format(city_id)),
+              ("/places/<id>/reviews",
+               "/places/{}/reviews".format(place_id)),
+              ("/reviews/<id>", "/reviews/" + review_id)]
+    calls = max(1, ops // 100)
+    for label, route in routes:
+        timed(results, "GET /api/v1" + label, calls,
+              lambda: [client.get("/api/v1" + route).get_data()
+                       for i in range(calls)])
+    timed(results, "POST /api/v1/states", calls,
+          lambda: [client.post("/api/v1/states", json={"name": "New"})
+                   for i in range(calls)])
+    timed(results, "PUT /api/v1/states/<id>", calls,
+          lambda: [client.put("/api/v1/states/{}".format(state_id),
+                              json={"name": "Renamed"})
+                   for i in range(calls)])
+    return results
+
+
+def compare(old, new):
+    """prints the ratio of new to old time for the measurements found in
+    both lists"""
+    def key(r):
+        return (r["engine"], r["scale"], r["op"])
+    before = {key(r): r for r in old}
+    print("{:6} {:>8} {:40} {:>12} {:>12} {:>7}".format(
+        "engine", "scale", "op", "old us/op", "new us/op", "ratio"))
+    for r in new:
+        if key(r) in before:
+            o = before[key(r)]["per_op_us"]
+            print("{:6} {:>8} {:40} {:>12.1f} {:>12.1f} {:>7.2f}".format(
+                r["engine"], r["scale"], r["op"], o, r["per_op_us"],
+                r["per_op_us"] / o if o else 0))
+
+
+def main():
+    """parses the command line and runs one child process per engine
+    and scale"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--engine", default="file",
+                        help="comma separated engines: file, db")
+    parser.add_argument("--scale", default="1000",
+                        help="comma separated number of objects")
+    parser.add_argument("--ops", type=int, default=1000,
+                        help="calls per lookup benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON lines file to write")
+    parser.add_argument("--compare", help="JSON lines file of a previous run")
+    parser.add_argument("--child", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        for r in run(int(args.scale), args.ops, args.seed):
+            print(json.dumps(r))
+        return
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for engine in args.engine.split(","):
+        for scale in args.scale.split(","):
+            with tempfile.TemporaryDirectory() as tmp:
+                env = dict(os.environ, PYTHONPATH=root)
+                env.pop("HBNB_TYPE_STORAGE", None)
+                if engine == "db":
+                    env["HBNB_TYPE_STORAGE"] = "db"
+                    env["HBNB_DB_URL"] = "sqlite:///" + os.path.join(
+                        tmp, "bench.db")
+                out = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.storage", "--child",
+                     "--scale", scale, "--ops", str(args.ops),
+                     "--seed", str(args.seed)],
+                    cwd=tmp, env=env, check=True, stdout=subprocess.PIPE,
+                    universal_newlines=True).stdout
+            for line in out.splitlines():
+                r = json.loads(line)
+                r.update(engine=engine, scale=int(scale))
+                results.append(r)
+                print(json.dumps(r), flush=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            for r in results:
+                f.write(json.dumps(r) + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            compare([json.loads(line) for line in f], results)
+
+
+if __name__ == "__main__":
+    main()
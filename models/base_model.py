@@ -12,6 +12,9 @@ from sqlalchemy.ext.declarative import declarative_base
 import uuid
 
 time = "%Y-%m-%dT%H:%M:%S.%f"
+compact = models.storage_t != "db" and getenv("HBNB_FILE_COMPACT") == "1"
+lazy = models.storage_t != "db" and not compact and \
+    getenv("HBNB_FILE_LAZY_TIMESTAMPS") == "1"
 
 if models.storage_t == "db":
     Base = declarative_base()
@@ -19,12 +22,84 @@ else:
     Base = object
 
 
-class BaseModel:
+def parse_time(value):
+    """returns the datetime of a string in the `time` format"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, time)
+
+
+def format_time(value):
+    """returns value.strftime(time), through the faster isoformat()"""
+    return value.isoformat(timespec="microseconds")
+
+
+class Timestamp:
+    """
+    Descriptor of created_at and updated_at in lazy mode: the string read
+    from storage stays in the instance __dict__ until first accessed
+    """
+    def __set_name__(self, owner, name):
+        """remembers the attribute name"""
+        self.name = name
+
+    def __get__(self, obj, owner=None):
+        """returns the datetime, parsing the stored string if needed"""
+        if obj is None:
+            return self
+        try:
+            value = obj.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name) from None
+        if type(value) is str:
+            value = parse_time(value)
+            obj.__dict__[self.name] = value
+        return value
+
+    def __set__(self, obj, value):
+        """stores value, a datetime or a string in the `time` format"""
+        obj.__dict__[self.name] = value
+
+
+class Compact(type):
+    """
+    Metaclass of the models in compact mode: the class level defaults
+    (name = "", amenity_ids = [] ...) become __slots__ and are kept in
+    _defaults, which BaseModel.__getattr__ reads while a slot is unset
+    """
+    def __new__(mcs, name, bases, namespace):
+        """moves the defaults of namespace into __slots__"""
+        own = {k: v for k, v in namespace.items()
+               if not k.startswith("_") and type(v) in (str, int, float,
+                                                        list)}
+        for k in own:
+            del namespace[k]
+        slots = tuple(namespace.get("__slots__", ())) + tuple(own)
+        namespace["__slots__"] = slots
+        defaults, order = {}, ()
+        for base in bases:
+            defaults.update(getattr(base, "_defaults", {}))
+            order += getattr(base, "_order", ())
+        defaults.update(own)
+        namespace["_defaults"] = defaults
+        namespace["_order"] = order + tuple(k for k in slots
+                                            if k != "_extra")
+        namespace["_fields"] = frozenset(namespace["_order"])
+        return super().__new__(mcs, name, bases, namespace)
+
+
+class BaseModel(metaclass=Compact if compact else type):
     """The BaseModel class from which future classes will be derived"""
     if models.storage_t == "db":
         id = Column(String(60), primary_key=True)
-        created_at = Column(DateTime, default=datetime.utcnow)
+        created_at = Column(DateTime, default=datetime.utcnow, index=True)
         updated_at = Column(DateTime, default=datetime.utcnow)
+    elif compact:
+        __slots__ = ("id", "created_at", "updated_at", "_extra")
+    elif lazy:
+        created_at = Timestamp()
+        updated_at = Timestamp()
 
     def __init__(self, *args, **kwargs):
         """Initialization of the base model"""
@@ -32,12 +107,16 @@ class BaseModel:
             for key, value in kwargs.items():
                 if key != "__class__":
                     setattr(self, key, value)
-            if kwargs.get("created_at", None) and type(self.created_at) is str:
-                self.created_at = datetime.strptime(kwargs["created_at"], time)
+            created_at = kwargs.get("created_at", None)
+            if created_at and type(created_at) is str:
+                if not lazy:
+                    self.created_at = parse_time(created_at)
             else:
                 self.created_at = datetime.now()
-            if kwargs.get("updated_at", None) and type(self.updated_at) is str:
-                self.updated_at = datetime.strptime(kwargs["updated_at"], time)
+            updated_at = kwargs.get("updated_at", None)
+            if updated_at and type(updated_at) is str:
+                if not lazy:
+                    self.updated_at = parse_time(updated_at)
             else:
                 self.updated_at = datetime.now()
             if kwargs.get("id", None) is None:
@@ -47,6 +126,59 @@ class BaseModel:
             self.created_at = datetime.now()
             self.updated_at = self.created_at
 
+    if compact:
+        def __setattr__(self, name, value):
+            """sets a slot, or an extra attribute kept in _extra, and
+            marks the instance dirty in storage"""
+            if name in self._fields:
+                object.__setattr__(self, name, value)
+            else:
+                try:
+                    extra = object.__getattribute__(self, "_extra")
+                except AttributeError:
+                    extra = {}
+                    object.__setattr__(self, "_extra", extra)
+                extra[name] = value
+            models.storage.mark(self, name)
+
+        def __getattr__(self, name):
+            """returns an extra attribute, else the class default of an
+            unset slot; a list default is first copied onto the instance
+            so that instances do not share it"""
+            try:
+                return object.__getattribute__(self, "_extra")[name]
+            except (AttributeError, KeyError):
+                pass
+            if name not in self._defaults:
+                raise AttributeError("'{}' object has no attribute '{}'"
+                                     .format(type(self).__name__, name))
+            value = self._defaults[name]
+            if type(value) is list:
+                value = list(value)
+                object.__setattr__(self, name, value)
+            return value
+
+        @property
+        def __dict__(self):
+            """returns the attributes set on the instance, as __dict__
+            does for the models without slots"""
+            attrs = {}
+            for name in self._order:
+                try:
+                    attrs[name] = object.__getattribute__(self, name)
+                except AttributeError:
+                    pass
+            try:
+                attrs.update(object.__getattribute__(self, "_extra"))
+            except AttributeError:
+                pass
+            return attrs
+    elif models.storage_t != "db":
+        def __setattr__(self, name, value):
+            """sets an attribute and marks the instance dirty in storage"""
+            super().__setattr__(name, value)
+            models.storage.mark(self, name)
+
     def __str__(self):
         """String representation of the BaseModel class"""
         return "[{:s}] ({:s}) {}".format(self.__class__.__name__, self.id,
@@ -61,10 +193,9 @@ class BaseModel:
     def to_dict(self):
         """returns a dictionary containing all keys/values of the instance"""
         new_dict = self.__dict__.copy()
-        if "created_at" in new_dict:
-            new_dict["created_at"] = new_dict["created_at"].strftime(time)
-        if "updated_at" in new_dict:
-            new_dict["updated_at"] = new_dict["updated_at"].strftime(time)
+        for name in ("created_at", "updated_at"):
+            if name in new_dict and type(new_dict[name]) is not str:
+                new_dict[name] = format_time(new_dict[name])
         new_dict["__class__"] = self.__class__.__name__
         if "_sa_instance_state" in new_dict:
             del new_dict["_sa_instance_state"]
@@ -3,27 +3,72 @@
 Contains the class DBStorage
 """
 
+from datetime import datetime
 import models
 from models.amenity import Amenity
 from models.base_model import BaseModel, Base
 from models.city import City
+from models.engine import geo
 from models.place import Place
 from models.review import Review
 from models.state import State
 from models.user import User
 from os import getenv
 import sqlalchemy
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy import create_engine, func, inspect, literal, select
+from sqlalchemy import and_, or_, union_all, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.orm import scoped_session, selectinload, sessionmaker
+from sqlalchemy.pool import QueuePool
+from time import monotonic
 
 classes = {"Amenity": Amenity, "City": City,
            "Place": Place, "Review": Review, "State": State, "User": User}
 
+# HBNB_MYSQL_* setting -> (create_engine argument, type of its value)
+pool_settings = {"HBNB_MYSQL_POOL_SIZE": ("pool_size", int),
+                 "HBNB_MYSQL_MAX_OVERFLOW": ("max_overflow", int),
+                 "HBNB_MYSQL_POOL_TIMEOUT": ("pool_timeout", float),
+                 "HBNB_MYSQL_POOL_RECYCLE": ("pool_recycle", int),
+                 "HBNB_MYSQL_POOL_PRE_PING": ("pool_pre_ping",
+                                              lambda v: v == "1")}
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that keeps how long sessions waited for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        """creates the pool with its wait counters at zero"""
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        """returns a connection, timing the wait for it"""
+        start = monotonic()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            self.timeouts += 1
+            raise
+        finally:
+            wait = monotonic() - start
+            self.waits += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
 
 class DBStorage:
     """interaacts with the MySQL database"""
     __engine = None
     __session = None
+    # dictionary - <class name> -> number of rows, None until counted
+    __counts = None
+    # float - monotonic time at which __counts was read from the database
+    __counted_at = 0
 
     def __init__(self):
         """Instantiate a DBStorage object"""
@@ -32,20 +77,50 @@ class DBStorage:
         HBNB_MYSQL_HOST = getenv('HBNB_MYSQL_HOST')
         HBNB_MYSQL_DB = getenv('HBNB_MYSQL_DB')
         HBNB_ENV = getenv('HBNB_ENV')
-        self.__engine = create_engine('mysql+mysqldb://{}:{}@{}/{}'.
-                                      format(HBNB_MYSQL_USER,
-                                             HBNB_MYSQL_PWD,
-                                             HBNB_MYSQL_HOST,
-                                             HBNB_MYSQL_DB))
+        HBNB_DB_URL = getenv('HBNB_DB_URL')
+        HBNB_MYSQL_COUNT_TTL = getenv('HBNB_MYSQL_COUNT_TTL')
+        self.__count_ttl = None
+        if HBNB_MYSQL_COUNT_TTL:
+            self.__count_ttl = float(HBNB_MYSQL_COUNT_TTL)
+        if HBNB_DB_URL is None:
+            HBNB_DB_URL = 'mysql+mysqldb://{}:{}@{}/{}'.format(
+                HBNB_MYSQL_USER, HBNB_MYSQL_PWD, HBNB_MYSQL_HOST,
+                HBNB_MYSQL_DB)
+        options = {}
+        for setting, (name, kind) in pool_settings.items():
+            value = getenv(setting)
+            if value:
+                options[name] = kind(value)
+        url = make_url(HBNB_DB_URL)
+        if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+            options["poolclass"] = TimedQueuePool
+        self.__engine = create_engine(url, **options)
         if HBNB_ENV == "test":
             Base.metadata.drop_all(self.__engine)
 
-    def all(self, cls=None):
-        """query on the current database session"""
+    def all(self, cls=None, eager=None, where=None, order_by=None,
+            limit=None):
+        """query on the current database session; eager names the
+        relationships (dotted for nested ones, e.g. "cities.places") to
+        load with the objects in one extra query each. where, order_by and
+        limit become the WHERE, ORDER BY and LIMIT of the query: where
+        maps columns to the values they must equal, order_by is a column
+        or a list of columns, "-name" for descending, ties in id order,
+        and limit keeps the first rows in that order, or in id order.
+        order_by and limit need cls."""
+        if cls is None and (order_by or limit is not None):
+            raise ValueError("order_by and limit need a class")
         new_dict = {}
         for clss in classes:
-            if cls is None or cls is classes[clss] or cls is clss:
-                objs = self.__session.query(classes[clss]).all()
+            if cls is None or cls is classes[clss] or cls == clss:
+                if where and not all(hasattr(classes[clss], field)
+                                     for field in where):
+                    continue
+                query = self.__select(classes[clss], where, order_by, limit)
+                if eager:
+                    query = query.options(*self.__loaders(classes[clss],
+                                                          eager))
+                objs = query.all()
                 for obj in objs:
                     key = obj.__class__.__name__ + '.' + obj.id
                     new_dict[key] = obj
@@ -53,15 +128,64 @@ class DBStorage:
 
     def new(self, obj):
         """add the object to the current database session"""
+        if inspect(obj).transient:
+            self.__count_change(obj, 1)
         self.__session.add(obj)
 
     def save(self):
         """commit all changes of the current database session"""
         self.__session.commit()
+        changes = self.__session.info.pop("count_changes", {})
+        if self.__counts is not None:
+            for clss, change in changes.items():
+                self.__counts[clss] = self.__counts.get(clss, 0) + change
+
+    def bulk_new(self, objs):
+        """adds every object of objs to the session and commits them at
+        once; the rows of a table go in batched INSERTs (executemany)"""
+        for obj in objs:
+            if inspect(obj).transient:
+                self.__count_change(obj, 1)
+        self.__session.add_all(objs)
+        self.save()
+
+    def bulk_update(self, cls, rows):
+        """
+        Updates the rows of cls from rows, dictionaries holding the id of
+        an object and the new values of its columns, with an executemany
+        UPDATE by primary key, then commits. Unknown ids and keys that
+        are not columns are skipped, id and created_at are kept,
+        updated_at is set to now.
+        Returns the number of objects updated.
+        """
+        if type(cls) is str:
+            cls = classes[cls]
+        columns = set(cls.__table__.columns.keys()) - \
+            {"id", "created_at", "updated_at"}
+        ids = list({row["id"] for row in rows if row.get("id") is not None})
+        found = set()
+        for i in range(0, len(ids), 500):
+            found.update(self.__session.scalars(
+                select(cls.id).where(cls.id.in_(ids[i:i + 500]))))
+        now = datetime.utcnow()
+        params = []
+        for row in rows:
+            if row.get("id") in found:
+                values = {k: v for k, v in row.items() if k in columns}
+                values.update(id=row["id"], updated_at=now)
+                params.append(values)
+        if params:
+            self.__session.execute(update(cls), params)
+        self.save()
+        # the bulk UPDATE bypasses the objects already loaded
+        self.__session.expire_all()
+        return len(params)
 
     def delete(self, obj=None):
         """delete from the current database session obj if not None"""
         if obj is not None:
+            if inspect(obj).persistent:
+                self.__count_change(obj, -1)
             self.__session.delete(obj)
 
     def reload(self):
@@ -70,24 +194,221 @@ class DBStorage:
         sess_factory = sessionmaker(bind=self.__engine, expire_on_commit=False)
         Session = scoped_session(sess_factory)
         self.__session = Session
+        self.__counts = None
 
     def close(self):
         """call remove() method on the private session attribute"""
         self.__session.remove()
 
-    def get(self, cls, id):
+    def get(self, cls, id, eager=None):
         """
         Returns the object based on the class and its ID,
-        or None if not found
+        or None if not found; eager works as in all()
         """
-        for obj in self.all(cls).values():
-            if obj.id == id:
-                return obj
+        if id is None:
+            return None
+        for clss in classes:
+            if cls is None or cls is classes[clss] or cls == clss:
+                options = self.__loaders(classes[clss], eager or ())
+                obj = self.__session.get(classes[clss], id, options=options)
+                if obj is not None:
+                    return obj
         return None
 
     def count(self, cls=None):
         """
         Returns the number of objects in storage matching the given class.
         If no class is passed, returns the count of all objects in storage.
+        The counts are read once from the database and then follow the
+        objects this process adds and deletes; with HBNB_MYSQL_COUNT_TTL
+        they are read again once older than that many seconds, to pick up
+        the writes of other processes.
         """
-        return len(self.all(cls).values())
+        if self.__counts is None or (
+                self.__count_ttl is not None and
+                monotonic() - self.__counted_at > self.__count_ttl):
+            self.__recount()
+        return sum(self.__counts.get(clss, 0) for clss in classes
+                   if cls is None or cls is classes[clss] or cls == clss)
+
+    @staticmethod
+    def __loaders(cls, eager):
+        """returns the selectin loader options for the relationship paths
+        in eager that exist on cls"""
+        options = []
+        for rel_path in eager:
+            owner, option = cls, None
+            for name in rel_path.split("."):
+                rel = inspect(owner).relationships.get(name)
+                if rel is None:
+                    option = None
+                    break
+                if option is None:
+                    option = selectinload(rel.class_attribute)
+                else:
+                    option = option.selectinload(rel.class_attribute)
+                owner = rel.mapper.class_
+            if option is not None:
+                options.append(option)
+        return options
+
+    def __recount(self):
+        """reads the number of rows of every table in a single query"""
+        query = union_all(*[select(literal(clss), func.count())
+                            .select_from(classes[clss])
+                            for clss in classes])
+        self.__counts = dict(tuple(row) for row in
+                             self.__session.execute(query))
+        self.__counted_at = monotonic()
+
+    def __count_change(self, obj, change):
+        """records a row added or deleted by the current session, applied
+        to the cached counts once save() commits it"""
+        changes = self.__session.info.setdefault("count_changes", {})
+        clss = obj.__class__.__name__
+        changes[clss] = changes.get(clss, 0) + change
+
+    def page(self, cls, limit, after=None, fk=None, value=None,
+             where=None, by="id"):
+        """
+        Returns a dictionary of at most limit objects of cls in id order,
+        starting after the id after; fk and value keep only the objects
+        whose foreign key fk equals value, where those whose columns
+        equal its values. With by="created_at" the objects are in
+        (created_at, id) order, read from the created_at index, and after
+        is such a pair
+        """
+        if by not in ("id", "created_at"):
+            raise ValueError("page() is by id or created_at")
+        if type(cls) is str:
+            cls = classes[cls]
+        query = self.__select(cls, where)
+        if fk is not None:
+            query = query.filter(getattr(cls, fk) == value)
+        order = [cls.id]
+        if by == "created_at":
+            order.insert(0, cls.created_at)
+            if after is not None:
+                query = query.filter(or_(
+                    cls.created_at > after[0],
+                    and_(cls.created_at == after[0], cls.id > after[1])))
+        elif after is not None:
+            query = query.filter(cls.id > after)
+        new_dict = {}
+        for obj in query.order_by(*order).limit(limit):
+            new_dict[obj.__class__.__name__ + '.' + obj.id] = obj
+        return new_dict
+
+    def search_places(self, states=(), cities=(), amenities=()):
+        """
+        Returns a dictionary of the places in the cities of states or in
+        cities, in id order, every place without those two, and keeps
+        the places offering all of amenities; one query, answered from
+        the indexes on cities.state_id, places.city_id and
+        place_amenity.amenity_id
+        """
+        from models.place import place_amenity
+        query = self.__session.query(Place)
+        if states or cities:
+            in_states = select(City.id).where(City.state_id.in_(set(states)))
+            query = query.filter(Place.city_id.in_(set(cities)) |
+                                 Place.city_id.in_(in_states))
+        if amenities:
+            amenities = set(amenities)
+            with_all = select(place_amenity.c.place_id).where(
+                place_amenity.c.amenity_id.in_(amenities)).group_by(
+                place_amenity.c.place_id).having(
+                func.count() == len(amenities))
+            query = query.filter(Place.id.in_(with_all))
+        new_dict = {}
+        for obj in query.order_by(Place.id):
+            new_dict[obj.__class__.__name__ + '.' + obj.id] = obj
+        return new_dict
+
+    def places_near(self, lat, lng, radius=None, box=None, limit=None):
+        """
+        Returns the list of (place, distance in km) of the places within
+        radius km of the point lat, lng and/or in box (south, west,
+        north, east), nearest first, at most limit of them. The bounding
+        boxes of the search are a range query on the places_location
+        index, the distances are computed on the rows it returns.
+        """
+        boxes = [search for search in
+                 (box, radius is not None and geo.circle_box(lat, lng, radius))
+                 if search]
+        if not boxes:
+            raise ValueError("places_near needs a radius or a box")
+        query = self.__session.query(Place)
+        for south, west, north, east in boxes:
+            query = query.filter(Place.latitude.between(south, north))
+            if west <= east:
+                query = query.filter(Place.longitude.between(west, east))
+            else:
+                query = query.filter(or_(Place.longitude >= west,
+                                         Place.longitude <= east))
+        return geo.nearest(lat, lng, query, radius, box, limit)
+
+    def __select(self, cls, where=None, order_by=None, limit=None):
+        """returns the query of the objects of cls with the WHERE, ORDER BY
+        and LIMIT of all()"""
+        query = self.__session.query(cls)
+        if where:
+            query = query.filter_by(**where)
+        if order_by:
+            fields = [order_by] if isinstance(order_by, str) else order_by
+            for field in fields:
+                column = getattr(cls, field.lstrip("-"))
+                query = query.order_by(column.desc() if field.startswith("-")
+                                       else column)
+        if order_by or limit is not None:
+            query = query.order_by(cls.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    def dirty(self):
+        """
+        Returns the set of keys of the objects added, changed or deleted
+        in the current session and not committed yet
+        """
+        keys = set()
+        for objs in (self.__session.new, self.__session.dirty,
+                     self.__session.deleted):
+            for obj in objs:
+                keys.add(obj.__class__.__name__ + '.' + str(obj.id))
+        return keys
+
+    def metrics(self):
+        """
+        Returns the counters FileStorage reports for its write-behind
+        mode, nothing being left pending as save() commits, and those of
+        the connection pool: connections checked out, overflow beyond
+        the pool size (0 while the pool is not full, where QueuePool
+        counts below zero), and the time spent waiting for a connection
+        """
+        pool = self.__engine.pool
+        stats = {"class": type(pool).__name__, "status": pool.status()}
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), checked_in=pool.checkedin(),
+                         checked_out=pool.checkedout(),
+                         overflow=max(0, pool.overflow()))
+        if isinstance(pool, TimedQueuePool):
+            stats.update(waits=pool.waits, wait_seconds=pool.wait_seconds,
+                         max_wait_seconds=pool.max_wait_seconds,
+                         timeouts=pool.timeouts)
+        return {"write_behind": False, "pending_objects": len(self.dirty()),
+                "unflushed_seconds": 0.0, "loss_window_seconds": 0.0,
+                "pool": stats}
+
+    def related(self, cls, fk, value):
+        """
+        Returns a dictionary of the objects of cls whose foreign key fk
+        equals value
+        """
+        if type(cls) is str:
+            cls = classes[cls]
+        new_dict = {}
+        objs = self.__session.query(cls).filter(getattr(cls, fk) == value)
+        for obj in objs:
+            new_dict[obj.__class__.__name__ + '.' + obj.id] = obj
+        return new_dict
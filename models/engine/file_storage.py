@@ -3,10 +3,22 @@
 Contains the FileStorage class
 """
 
+import atexit
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import datetime
 import json
+import mmap
+from os import (O_RDONLY, close, fstat, fsync, getenv, getpid,
+                open as os_open, path, remove, replace, stat)
+from threading import Condition, RLock, Thread, get_ident
+from time import monotonic, sleep, time
 from models.amenity import Amenity
-from models.base_model import BaseModel
+from models.base_model import BaseModel, compact
 from models.city import City
+from models.engine import geo
+from models.engine.locks import RWLock, file_lock
+from models.engine.serializers import formats
 from models.place import Place
 from models.review import Review
 from models.state import State
@@ -15,72 +27,1203 @@ from models.user import User
 classes = {"Amenity": Amenity, "BaseModel": BaseModel, "City": City,
            "Place": Place, "Review": Review, "State": State, "User": User}
 
+# foreign keys indexed for each class name
+relations = {"City": ("state_id",),
+             "Place": ("city_id", "user_id", "amenity_ids", "cell"),
+             "Review": ("place_id", "user_id")}
+# foreign keys holding a list of ids, indexed under each of them
+listed = {("Place", "amenity_ids")}
+# class name -> (latitude, longitude) attributes, indexed under the key
+# "cell" by the grid cell of geo they fall in
+located = {"Place": ("latitude", "longitude")}
+# number of filters of a class whose matching ids page() keeps at once
+WHERE_IDS = 32
+
+
+def indexed_values(name, fk, get):
+    """returns the values under which the foreign key fk of an object of
+    class name is indexed, get(attribute) reading the object: each id of
+    a listed key, the grid cell of a location, else the value of fk"""
+    if fk == "cell":
+        try:
+            return (geo.cell(*(float(get(attr)) for attr in located[name])),)
+        except (TypeError, ValueError):
+            return ()
+    if (name, fk) in listed:
+        return tuple(get(fk) or ())
+    return (get(fk),)
+
+
+def record_getter(name, value):
+    """returns get(attribute) over the dictionary value of an object of
+    class name read from the files, the class default when unset as for
+    the instance"""
+    cls = classes[name]
+    defaults = getattr(cls, "_defaults", {})
+
+    def get(attr):
+        """returns the attribute attr of the object"""
+        if attr in value:
+            return value[attr]
+        return defaults.get(attr, getattr(cls, attr, None))
+    return get
+
 
 class FileStorage:
     """serializes instances to a JSON file & deserializes back to instances"""
 
-    # string - path to the JSON file
-    __file_path = "file.json"
+    # serializer of the files, picked by HBNB_FILE_FORMAT (json, binary
+    # or msgpack); json by default
+    __format = formats[getenv("HBNB_FILE_FORMAT") or "json"]()
+    # string - path to the JSON file, file.bin in the binary format
+    __file_path = "file" + __format.extension
     # dictionary - empty but will store all objects by <class name>.id
     __objects = {}
+    # dictionary - <class name> -> {<class name>.id: obj}
+    __classes = {}
+    # dictionary - (<class name>, <foreign key>) -> {value: {key: obj}}
+    __relations = {}
+    # dictionary - <class name>.id -> {<foreign key>: indexed values}
+    __indexed_fks = {}
+    # dictionary - <class name> -> ids of its objects, sorted on demand
+    __ids = {}
+    # set - class names whose list in __ids has unsorted appends
+    __unsorted = set()
+    # dictionary - (<class name>, <foreign key>, value) -> sorted ids
+    __related_ids = {}
+    # dictionary - <class name> -> {(<foreign key>, value, where, by):
+    # sorted ids or (created_at, id)}, dropped whenever an object of the
+    # class is stored, changed or removed
+    __where_ids = {}
+    # the __objects dictionary the indexes above were built from
+    __indexed = None
+    # readers-writer lock: all(), get(), count()... read, new(), delete(),
+    # save()... write
+    __lock = RWLock()
+    # lock of the caches that reads fill: the instances built from __raw,
+    # the sorted ids, the foreign key index of __raw, the rebuilt indexes
+    __cache = RLock()
+    # bool - append changes to __journal_path instead of rewriting the file
+    __journal = getenv("HBNB_FILE_JOURNAL") == "1"
+    # string - path to the journal replayed over __file_path, JSON lines
+    # or length-prefixed records depending on __format
+    __journal_path = __file_path + ".journal"
+    # set - keys of the objects added, changed or deleted since last flush
+    __dirty = set()
+    # dictionary - <class name>.id -> (obj, its last encoded record)
+    __encoded = {}
+    # bool - keep the records of clean objects in __encoded so save()
+    # does not encode them again; HBNB_FILE_ENCODE_CACHE, off by default
+    # in compact mode where the records would outweigh the instances
+    __encode_cache = (getenv("HBNB_FILE_ENCODE_CACHE") or
+                      ("0" if compact else "1")) == "1"
+    # int - number of entries in the journal since the last compaction
+    __journal_size = 0
+    # int - smallest journal that save() folds back into __file_path
+    __compact_after = 1000
+    # bool - the journal ends with a line torn by an interrupted append
+    __torn = False
+    # int - bytes of the journal already applied to __objects
+    __journal_offset = 0
+    # tuple - stat signatures of __file_path and __journal_path as last
+    # read or written by this process
+    __stamp = None
+    # bool - reload() keeps the objects read as dictionaries until used
+    __lazy = getenv("HBNB_FILE_LAZY_LOAD") == "1"
+    # dictionary - <class name> -> {<class name>.id: dictionary read from
+    # the files, or (map, offset, length) of its record in a mapped file},
+    # the objects not turned into instances yet in lazy or mapped mode
+    __raw = {}
+    # dictionary - (<class name>, <foreign key>) -> {value: set of keys
+    # in __raw}, built on demand
+    __raw_fks = {}
+    # bool - one file per class, named after __file_path: file.State.json
+    __sharded = getenv("HBNB_FILE_SHARDED") == "1"
+    # set - class names whose shard is behind the objects in memory
+    __stale = set()
+    # bool - reload() maps the files with mmap and reads only the offset
+    # index written next to them (file.json.idx), records are decoded
+    # when their object is first used
+    __mapped = getenv("HBNB_FILE_MMAP") == "1"
+    # bool - several processes share the files: writes hold an exclusive
+    # lock on __file_path + ".lock" and first merge the changes the other
+    # processes committed, reads hold it shared
+    __shared = getenv("HBNB_FILE_SHARED") == "1"
+    # int - depth of the nested calls holding the lock file
+    __held = 0
+    # tuple - stat signature of the lock file when this process last
+    # caught up with the files; each commit appends a byte to it
+    __generation = None
+    # set - keys that a merge or close() does not overwrite, the local
+    # changes
+    __keep = set()
+    # set - keys read from the files during a merge, None otherwise
+    __seen = None
+    # float - seconds a save() waits for others to join its write, from
+    # HBNB_FILE_GROUP_COMMIT in milliseconds; 0 writes at once
+    __window = float(getenv("HBNB_FILE_GROUP_COMMIT") or 0) / 1000
+    # condition guarding the group commit counters below
+    __group = Condition()
+    # int - number of the group that save() calls join
+    __batch = 0
+    # int - number of the last group written
+    __written = -1
+    # bool - a save() is waiting to write the group __batch
+    __leading = False
+    # dictionary - group number -> number of save() calls waiting for it
+    __joined = {}
+    # dictionary - group number -> exception its write raised, kept until
+    # the save() calls waiting for it have seen it
+    __failed = {}
+    # float - write-behind mode: save() returns at once and a thread
+    # writes the changes at most this many seconds later, from
+    # HBNB_FILE_WRITE_BEHIND; 0 writes in save()
+    __behind = float(getenv("HBNB_FILE_WRITE_BEHIND") or 0)
+    # int - number of dirty objects that makes the thread write early
+    __behind_max = int(getenv("HBNB_FILE_WRITE_BEHIND_MAX") or 1000)
+    # condition the write-behind thread waits on
+    __flushing = Condition()
+    # the write-behind thread, started by the first save()
+    __flusher = None
+    # float - monotonic time of the oldest save() not written yet, None
+    # when every save() is on disk
+    __pending_since = None
+    # dictionary - write-behind counters reported by metrics()
+    __flushes = {"flushes": 0, "errors": 0, "last_flush_at": None,
+                 "last_flush_seconds": 0.0, "max_flush_seconds": 0.0,
+                 "max_unflushed_seconds": 0.0}
 
-    def all(self, cls=None):
-        """returns the dictionary __objects"""
-        if cls is not None:
-            new_dict = {}
-            for key, value in self.__objects.items():
-                if cls == value.__class__ or cls == value.__class__.__name__:
-                    new_dict[key] = value
-            return new_dict
-        return self.__objects
+    def all(self, cls=None, eager=None, where=None, order_by=None,
+            limit=None):
+        """
+        Returns a copy of the dictionary __objects, or the objects of cls.
+        where keeps the objects whose attributes equal its values, read
+        from the foreign key index when it names an indexed key; order_by
+        sorts them on an attribute or a list of attributes, "-name" for
+        descending, ties in id order; limit keeps the first limit objects
+        in that order, or in id order. order_by and limit need cls.
+        eager is accepted for compatibility with DBStorage, relationships
+        are index reads here.
+        """
+        if where or order_by or limit is not None:
+            return self.__select(cls, where or {}, order_by, limit)
+        with self.__lock.read():
+            self.__sync()
+            if cls is not None:
+                name = cls if isinstance(cls, str) else cls.__name__
+                for key in list(self.__raw.get(name, ())):
+                    self.__materialize(key)
+                return dict(self.__classes.get(name, {}))
+            for name in list(self.__raw):
+                for key in list(self.__raw[name]):
+                    self.__materialize(key)
+            return dict(self.__objects)
 
     def new(self, obj):
         """sets in __objects the obj with key <obj class name>.id"""
-        if obj is not None:
-            key = obj.__class__.__name__ + "." + obj.id
-            self.__objects[key] = obj
+        with self.__lock.write():
+            if obj is not None:
+                key = obj.__class__.__name__ + "." + obj.id
+                self.__put(key, obj)
+                self.__dirty.add(key)
+
+    def bulk_new(self, objs):
+        """adds every object of objs as new() does, then saves them all
+        with a single write"""
+        with self.__lock.write():
+            for obj in objs:
+                self.new(obj)
+        self.save()
+
+    def bulk_update(self, cls, rows):
+        """
+        Sets on the objects of cls the values of rows, dictionaries
+        holding the id of an object and its new attributes, then saves
+        them with a single write. Unknown ids are skipped, id and
+        created_at are kept, updated_at is set to now.
+        Returns the number of objects updated.
+        """
+        now = datetime.utcnow()
+        updated = 0
+        with self.__lock.write():
+            for row in rows:
+                obj = self.get(cls, row.get("id"))
+                if obj is None:
+                    continue
+                for k, v in row.items():
+                    if k not in ("id", "created_at", "updated_at",
+                                 "__class__"):
+                        setattr(obj, k, v)
+                obj.updated_at = now
+                updated += 1
+        self.save()
+        return updated
 
     def save(self):
-        """serializes __objects to the JSON file (path: __file_path)"""
-        json_objects = {}
-        for key in self.__objects:
-            json_objects[key] = self.__objects[key].to_dict()
-        with open(self.__file_path, 'w') as f:
-            json.dump(json_objects, f)
+        """serializes __objects to the JSON file (path: __file_path),
+        or appends the dirty objects to the journal in journal mode; with
+        a group commit window, the save() calls made while one waits for
+        the window to end are written to disk once, together; in
+        write-behind mode the changes are left to the flusher thread"""
+        if self.__behind > 0:
+            self.__defer()
+            return
+        if self.__window <= 0:
+            with self.__lock.write():
+                self.__commit()
+            return
+        with self.__group:
+            batch = self.__batch
+            leader = not self.__leading
+            FileStorage.__leading = True
+            if not leader:
+                self.__joined[batch] = self.__joined.get(batch, 0) + 1
+        if not leader:
+            with self.__group:
+                while self.__written < batch:
+                    self.__group.wait()
+                error = self.__failed.get(batch)
+                self.__joined[batch] -= 1
+                if not self.__joined[batch]:
+                    del self.__joined[batch]
+                    self.__failed.pop(batch, None)
+            if error is not None:
+                raise error
+            return
+        sleep(self.__window)
+        with self.__group:
+            FileStorage.__batch += 1
+            FileStorage.__leading = False
+        error = None
+        try:
+            with self.__lock.write():
+                self.__commit()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            with self.__group:
+                if error is not None and batch in self.__joined:
+                    self.__failed[batch] = error
+                FileStorage.__written = max(self.__written, batch)
+                self.__group.notify_all()
+
+    def compact(self):
+        """writes every object to __file_path and empties the journal,
+        reusing the encoding of the objects that are not dirty; in the
+        sharded layout only the shards of the changed classes are written"""
+        with self.__lock.write(), self.__holding():
+            self.__sync()
+            if self.__sharded:
+                names = self.__stale | {key.split(".", 1)[0]
+                                        for key in self.__dirty}
+                for name in names:
+                    objs = self.__classes.get(name, {})
+                    raw = self.__raw.get(name, {})
+                    if objs or raw:
+                        self.__write(self.__shard(name), objs, [raw])
+                    else:
+                        for file_path in (self.__shard(name),
+                                          self.__shard(name) + ".idx"):
+                            if path.exists(file_path):
+                                remove(file_path)
+            else:
+                self.__write(self.__file_path, self.__objects,
+                             self.__raw.values())
+            # the new files are on disk before the journal goes away
+            self.__sync_dir(self.__file_path)
+            if path.exists(self.__journal_path):
+                remove(self.__journal_path)
+            FileStorage.__journal_size = 0
+            FileStorage.__torn = False
+            FileStorage.__journal_offset = 0
+            FileStorage.__stamp = self.__signature()
+            FileStorage.__stale = set()
+            self.__dirty.clear()
+
+    def migrate(self, sharded=None, fmt=None):
+        """
+        Rewrites the stored objects in the sharded layout, or in the
+        single file one, and removes the files of the other layout.
+        The objects are read from the other layout, journal included.
+        With fmt, the name of a format in formats, the files are also
+        rewritten in that format, named with its extension; the layout is
+        kept when sharded is None.
+        """
+        with self.__lock.write(), self.__holding():
+            FileStorage.__objects = {}
+            lazy, mapped = self.__lazy, self.__mapped
+            FileStorage.__lazy = True
+            FileStorage.__mapped = False
+            if sharded is not None:
+                FileStorage.__sharded = not sharded
+            try:
+                self.reload()
+                old = self.__paths() + [self.__journal_path]
+                if sharded is not None:
+                    FileStorage.__sharded = sharded
+                if fmt is not None:
+                    FileStorage.__format = formats[fmt]()
+                    FileStorage.__file_path = path.splitext(
+                        self.__file_path)[0] + self.__format.extension
+                    FileStorage.__journal_path = self.__file_path + ".journal"
+                    FileStorage.__encoded = {}
+                FileStorage.__stale = set(classes)
+                self.compact()
+            finally:
+                FileStorage.__lazy, FileStorage.__mapped = lazy, mapped
+            new = self.__paths()
+            for file_path in old:
+                if file_path not in new:
+                    for name in (file_path, file_path + ".idx"):
+                        if path.exists(name):
+                            remove(name)
 
     def reload(self):
-        """deserializes the JSON file to __objects"""
-        try:
-            with open(self.__file_path, 'r') as f:
-                jo = json.load(f)
-            for key in jo:
-                self.__objects[key] = classes[jo[key]["__class__"]](**jo[key])
-        except:
-            pass
+        """deserializes the JSON file to __objects, then replays the
+        journal over it; in lazy mode the objects not already in
+        __objects are only kept as dictionaries until first returned, in
+        mapped mode as the position of their record in the file"""
+        with self.__lock.write(), self.__holding(shared=True):
+            stamp = self.__signature()
+            self.__sync()
+            for file_path in self.__paths():
+                self.__read(file_path)
+            FileStorage.__journal_size = 0
+            FileStorage.__journal_offset = 0
+            self.__replay()
+            FileStorage.__stamp = stamp
 
     def delete(self, obj=None):
         """delete obj from __objects if it’s inside"""
-        if obj is not None:
-            key = obj.__class__.__name__ + '.' + obj.id
-            if key in self.__objects:
-                del self.__objects[key]
+        with self.__lock.write():
+            if obj is not None:
+                key = obj.__class__.__name__ + '.' + obj.id
+                if key in self.__objects:
+                    self.__pop(key)
+                    self.__dirty.add(key)
 
     def close(self):
-        """call reload() method for deserializing the JSON file to objects"""
-        self.reload()
+        """picks up the changes made to the files since they were last
+        read or written: nothing when they are untouched, the changed
+        files and the new journal entries when the journal only grew,
+        else a reload(); in shared mode, nothing unless another process
+        committed since, else the changes merged as in save(). In
+        write-behind mode the changes not flushed yet are kept."""
+        if self.__shared:
+            if self.__generation_stamp() == self.__generation:
+                return
+            with self.__lock.write(), self.__holding(shared=True):
+                self.__merge()
+            return
+        if self.__signature() == self.__stamp:
+            return
+        with self.__lock.write():
+            stamp = self.__signature()
+            old = self.__stamp
+            if stamp == old:
+                return
+            if self.__behind:
+                FileStorage.__keep = set(self.__dirty)
+            try:
+                if old is not None and len(old) == len(stamp) and \
+                        self.__grew(old[-1], stamp[-1]):
+                    for file_path, before, after in zip(self.__paths(),
+                                                        old, stamp):
+                        if before != after:
+                            self.__read(file_path)
+                    self.__replay()
+                    FileStorage.__stamp = stamp
+                    return
+                self.reload()
+            finally:
+                FileStorage.__keep = set()
 
-    def get(self, cls, id):
+    def get(self, cls, id, eager=None):
         """
         Returns the object based on the class and its ID,
-        or None if not found"""
-        for obj in self.all(cls).values():
-            if obj.id == id:
-                return obj
-        return None
+        or None if not found; eager is ignored as in all()"""
+        with self.__lock.read():
+            if cls is None or id is None:
+                return None
+            name = cls if isinstance(cls, str) else cls.__name__
+            key = name + "." + str(id)
+            obj = self.__objects.get(key)
+            if obj is None and self.__raw:
+                self.__sync()
+                if key in self.__raw.get(name, ()):
+                    obj = self.__materialize(key)
+            return obj
 
     def count(self, cls=None):
         """
         Returns the number of objects in storage matching the given class.
         If no class is passed, returns the count of all objects in storage.
         """
-        return len(self.all(cls).values())
+        with self.__lock.read():
+            self.__sync()
+            if cls is None:
+                return len(self.__objects) + sum(len(objs) for objs in
+                                                 self.__raw.values())
+            name = cls if isinstance(cls, str) else cls.__name__
+            return len(self.__classes.get(name, {})) + \
+                len(self.__raw.get(name, ()))
+
+    def mark(self, obj, name=None):
+        """
+        Flags a stored obj as changed so the next save() writes it;
+        changing one of its foreign keys also moves it in the index
+        """
+        key = obj.__class__.__name__ + "." + str(getattr(obj, "id", None))
+        if self.__objects.get(key) is not obj:
+            return
+        with self.__lock.write():
+            if self.__objects.get(key) is obj:
+                self.__dirty.add(key)
+                name_cls = obj.__class__.__name__
+                self.__where_ids.pop(name_cls, None)
+                if name in relations.get(name_cls, ()) or \
+                        name in located.get(name_cls, ()):
+                    self.__put(key, obj)
+
+    def flush(self):
+        """writes now the changes save() left to the write-behind thread;
+        runs at exit too"""
+        with self.__flushing:
+            since = self.__pending_since
+            FileStorage.__pending_since = None
+        if since is None:
+            return
+        start = monotonic()
+        try:
+            with self.__lock.write():
+                self.__commit()
+        except BaseException:
+            with self.__flushing:
+                FileStorage.__pending_since = since
+                self.__flushes["errors"] += 1
+            raise
+        end = monotonic()
+        with self.__flushing:
+            stats = self.__flushes
+            stats["flushes"] += 1
+            stats["last_flush_at"] = time()
+            stats["last_flush_seconds"] = end - start
+            stats["max_flush_seconds"] = max(stats["max_flush_seconds"],
+                                             end - start)
+            stats["max_unflushed_seconds"] = max(
+                stats["max_unflushed_seconds"], end - since)
+
+    def metrics(self):
+        """
+        Returns a dictionary of the write-behind counters: the dirty
+        objects and the age of the oldest save() not on disk yet, what a
+        crash would lose now; loss_window_seconds bounds that age, the
+        write-behind delay plus the longest write seen
+        """
+        with self.__flushing:
+            since = self.__pending_since
+            metrics = dict(self.__flushes)
+        metrics["write_behind"] = self.__behind > 0
+        metrics["write_behind_seconds"] = self.__behind
+        metrics["write_behind_max"] = self.__behind_max
+        metrics["pending_objects"] = len(self.__dirty)
+        metrics["unflushed_seconds"] = \
+            0.0 if since is None else monotonic() - since
+        metrics["loss_window_seconds"] = self.__behind + \
+            metrics["max_flush_seconds"] if self.__behind > 0 else 0.0
+        return metrics
+
+    def dirty(self):
+        """Returns the set of keys of the objects added, changed or
+        deleted since the last save()"""
+        with self.__lock.read():
+            return set(self.__dirty)
+
+    def related(self, cls, fk, value):
+        """
+        Returns a dictionary of the objects of cls whose foreign key fk
+        equals value, read from the foreign key index when there is one
+        """
+        with self.__lock.read():
+            name = cls if isinstance(cls, str) else cls.__name__
+            if fk not in relations.get(name, ()):
+                return {key: obj for key, obj in self.all(cls).items()
+                        if getattr(obj, fk, None) == value}
+            self.__sync()
+            if self.__raw.get(name):
+                for key in list(self.__raw_related(name, fk).get(value, ())):
+                    self.__materialize(key)
+            bucket = self.__relations.get((name, fk), {}).get(value, {})
+            return {key: obj for key, obj in list(bucket.items())
+                    if value in indexed_values(
+                        name, fk, lambda attr: getattr(obj, attr, None))}
+
+    def page(self, cls, limit, after=None, fk=None, value=None,
+             where=None, by="id"):
+        """
+        Returns a dictionary of at most limit objects of cls in id order,
+        starting after the id after; fk and value keep only the objects
+        whose foreign key fk equals value, where those whose attributes
+        equal its values. With by="created_at" the objects are in
+        (created_at, id) order and after is such a pair
+        """
+        if by not in ("id", "created_at"):
+            raise ValueError("page() is by id or created_at")
+        with self.__lock.read():
+            name = cls if isinstance(cls, str) else cls.__name__
+            if where or by != "id":
+                try:
+                    cached = (fk, value, frozenset((where or {}).items()), by)
+                except TypeError:
+                    cached = None
+                ids = self.__where_ids.get(name, {}).get(cached)
+                if ids is None:
+                    where = dict(where or {})
+                    if fk is not None:
+                        where[fk] = value
+                    objs = self.all(cls, where=where)
+                    if by == "id":
+                        ids = sorted(key[len(name) + 1:] for key in objs)
+                    else:
+                        ids = sorted((obj.created_at, obj.id)
+                                     for obj in objs.values())
+                    if cached is not None:
+                        found = self.__where_ids.setdefault(name, {})
+                        if len(found) >= WHERE_IDS:
+                            found.clear()
+                        found[cached] = ids
+            elif fk is None:
+                self.__sync()
+                ids = self.__ordered(name)
+            else:
+                ids = self.__related_ids.get((name, fk, value))
+                if ids is None:
+                    ids = sorted(key[len(name) + 1:]
+                                 for key in self.related(cls, fk, value))
+                    if fk in relations.get(name, ()):
+                        self.__related_ids[(name, fk, value)] = ids
+            start = 0 if after is None else bisect_right(ids, after)
+            new_dict = {}
+            for id in ids[start:start + limit]:
+                key = name + "." + (id if by == "id" else id[1])
+                obj = self.__objects.get(key)
+                new_dict[key] = obj if obj is not None else \
+                    self.__materialize(key)
+            return new_dict
+
+    def search_places(self, states=(), cities=(), amenities=()):
+        """
+        Returns a dictionary of the places in the cities of states or in
+        cities, in id order, every place without those two, and keeps
+        the places offering all of amenities. Each filter reads its
+        foreign key index (state -> cities, city -> places, amenity ->
+        places) and the smallest set is intersected with the others, so
+        the work follows the size of the matches, not of the storage.
+        """
+        with self.__lock.read():
+            matches = []
+            if states or cities:
+                city_ids = set(cities)
+                for state_id in set(states):
+                    city_ids.update(key.split(".", 1)[1] for key in
+                                    self.related(City, "state_id", state_id))
+                places = {}
+                for city_id in city_ids:
+                    places.update(self.related(Place, "city_id", city_id))
+                matches.append(places)
+            for amenity_id in set(amenities):
+                matches.append(self.related(Place, "amenity_ids",
+                                            amenity_id))
+            if not matches:
+                return self.all(Place, order_by="id")
+            matches.sort(key=len)
+            places = matches[0]
+            for other in matches[1:]:
+                places = {key: obj for key, obj in places.items()
+                          if key in other}
+            return dict(sorted(places.items()))
+
+    def places_near(self, lat, lng, radius=None, box=None, limit=None):
+        """
+        Returns the list of (place, distance in km) of the places within
+        radius km of the point lat, lng and/or in box (south, west,
+        north, east), nearest first, at most limit of them. The places
+        are read from the grid cells covering the search, or all of them
+        when there are more cells than places.
+        """
+        boxes = [search for search in
+                 (box, radius is not None and geo.circle_box(lat, lng, radius))
+                 if search]
+        if not boxes:
+            raise ValueError("places_near needs a radius or a box")
+        size, covering = min((geo.cells(search) for search in boxes),
+                             key=lambda cells: cells[0])
+        with self.__lock.read():
+            if size > self.count(Place):
+                return geo.nearest(lat, lng, self.all(Place).values(),
+                                   radius, box, limit)
+            covering = list(covering)
+            self.__sync()
+            if self.__raw.get("Place"):
+                raw = self.__raw_related("Place", "cell")
+                for cell in covering:
+                    for key in list(raw.get(cell, ())):
+                        self.__materialize(key)
+            buckets = self.__relations.get(("Place", "cell"), {})
+            places = []
+            for cell in covering:
+                bucket = buckets.get(cell)
+                if bucket:
+                    places.extend(bucket.values())
+            return geo.nearest(lat, lng, places, radius, box, limit)
+
+    def __select(self, cls, where, order_by, limit):
+        """all() with where, order_by or limit: filters the objects of
+        cls, or of every class, from the smallest index at hand"""
+        if cls is None and (order_by or limit is not None):
+            raise ValueError("order_by and limit need a class")
+        with self.__lock.read():
+            name = None if cls is None else \
+                cls if isinstance(cls, str) else cls.__name__
+            fks = [fk for fk in where if fk in relations.get(name, ())]
+            if fks:
+                objs = self.related(cls, fks[0], where[fks[0]])
+            else:
+                objs = self.all(cls)
+            items = [(key, obj) for key, obj in objs.items()
+                     if all(getattr(obj, field, None) == value
+                            for field, value in where.items())]
+        if order_by or limit is not None:
+            items.sort(key=lambda item: item[0])
+        if order_by:
+            fields = [order_by] if isinstance(order_by, str) else order_by
+            # one stable sort per field, from the last one to the first
+            for field in reversed(fields):
+                name = field.lstrip("-")
+                items.sort(key=lambda item: self.__sort_key(
+                    getattr(item[1], name, None)),
+                    reverse=field.startswith("-"))
+        return dict(items[:limit])
+
+    @staticmethod
+    def __sort_key(value):
+        """returns the sort key of an attribute value, None last"""
+        return (value is None, value)
+
+    def __commit(self):
+        """writes the changes of save() and flushes them to disk"""
+        with self.__holding():
+            if not self.__journal or self.__torn:
+                self.compact()
+                return
+            if not self.__dirty:
+                return
+            refresh = self.__stamp == self.__signature()
+            created = not path.exists(self.__journal_path)
+            with open(self.__journal_path, 'ab') as f:
+                for key in self.__dirty:
+                    obj = self.__objects.get(key)
+                    if obj is not None:
+                        entry = {"key": key, "value": obj.to_dict()}
+                    else:
+                        entry = {"key": key, "deleted": True}
+                    f.write(self.__format.entry(entry))
+                offset = f.tell()
+                f.flush()
+                fsync(f.fileno())
+            if created:
+                self.__sync_dir(self.__journal_path)
+            FileStorage.__journal_size += len(self.__dirty)
+            self.__stale.update(key.split(".", 1)[0] for key in self.__dirty)
+            self.__dirty.clear()
+            if refresh:
+                FileStorage.__journal_offset = offset
+                FileStorage.__stamp = self.__signature()
+            if self.__journal_size >= max(self.__compact_after, self.count()):
+                self.compact()
+
+    def __defer(self):
+        """leaves a save() to the write-behind thread, started on first
+        use, and wakes it when its timer starts or enough objects are
+        dirty"""
+        with self.__flushing:
+            if self.__pending_since is None:
+                FileStorage.__pending_since = monotonic()
+                # the thread sleeps without a timeout while nothing is
+                # pending: let it arm the timer of this save()
+                self.__flushing.notify_all()
+            if self.__flusher is None:
+                FileStorage.__flusher = Thread(target=self.__flush_loop,
+                                               name="FileStorage.flush",
+                                               daemon=True)
+                self.__flusher.start()
+                atexit.register(self.flush)
+            if len(self.__dirty) >= self.__behind_max:
+                self.__flushing.notify_all()
+
+    def __flush_loop(self):
+        """body of the write-behind thread: flush() once the oldest
+        pending save() is __behind seconds old, or as soon as
+        __behind_max objects are dirty; after a failed write, retries
+        __behind seconds later"""
+        while True:
+            with self.__flushing:
+                while True:
+                    since = self.__pending_since
+                    left = None
+                    if since is not None:
+                        left = since + self.__behind - monotonic()
+                        if left <= 0 or \
+                                len(self.__dirty) >= self.__behind_max:
+                            break
+                    self.__flushing.wait(left)
+            try:
+                self.flush()
+            except Exception:
+                sleep(self.__behind)
+
+    @contextmanager
+    def __holding(self, shared=False):
+        """
+        Holds the lock file for the duration of a with block in shared
+        mode, unless a caller already does. Exclusive holds merge the
+        changes of the other processes first, then append a byte to the
+        lock file: the new generation the other processes look for.
+        """
+        if not self.__shared or self.__held:
+            yield
+            return
+        with file_lock(self.__file_path + ".lock", shared) as f:
+            FileStorage.__held += 1
+            try:
+                if shared:
+                    generation = self.__generation_stamp(f)
+                    yield
+                else:
+                    self.__merge()
+                    yield
+                    if fstat(f.fileno()).st_size >= 4096:
+                        f.truncate(0)
+                    f.write(b"\n")
+                    f.flush()
+                    generation = self.__generation_stamp(f)
+                FileStorage.__generation = generation
+            finally:
+                FileStorage.__held -= 1
+
+    def __generation_stamp(self, f=None):
+        """returns the (inode, size, mtime) of the lock file, or of its
+        open file f, None when it is missing"""
+        try:
+            st = fstat(f.fileno()) if f else stat(self.__file_path + ".lock")
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def __merge(self):
+        """
+        Picks up the changes committed to the files since they were last
+        read or written, keeping the dirty objects as they are here: the
+        new journal entries when only the journal grew, else the changed
+        files and the whole journal, the objects of the classes in the
+        changed files that are found in neither being removed.
+        """
+        stamp = self.__signature()
+        old = self.__stamp
+        if stamp == old:
+            return
+        if old is None or len(old) != len(stamp):
+            changed = list(range(len(stamp) - 1))
+        else:
+            changed = [i for i in range(len(stamp) - 1)
+                       if old[i] != stamp[i]]
+        if changed or not self.__grew(old[-1], stamp[-1]):
+            FileStorage.__journal_size = 0
+            FileStorage.__journal_offset = 0
+        names = set()
+        if changed:
+            names = {list(classes)[i] for i in changed} if self.__sharded \
+                else set(classes)
+        paths = self.__paths()
+        FileStorage.__keep = set(self.__dirty)
+        FileStorage.__seen = set()
+        try:
+            for i in changed:
+                self.__read(paths[i])
+            self.__replay()
+            for name in names:
+                for key in list(self.__classes.get(name, {})) + \
+                        list(self.__raw.get(name, {})):
+                    if key not in self.__seen and key not in self.__keep:
+                        self.__pop(key)
+        finally:
+            FileStorage.__keep = set()
+            FileStorage.__seen = None
+        FileStorage.__stamp = stamp
+
+    def __put(self, key, obj):
+        """stores obj under key in __objects and the indexes"""
+        self.__sync()
+        self.__where_ids.pop(key.split(".", 1)[0], None)
+        if key in self.__objects:
+            self.__unindex(key)
+        elif not self.__forget(key):
+            name, id = key.split(".", 1)
+            ids = self.__ids.get(name)
+            if ids is not None:
+                ids.append(id)
+                self.__unsorted.add(name)
+        self.__objects[key] = obj
+        self.__index(key, obj)
+
+    def __pop(self, key):
+        """removes the object stored under key from __objects"""
+        self.__sync()
+        self.__where_ids.pop(key.split(".", 1)[0], None)
+        if key in self.__objects or self.__forget(key):
+            if key in self.__objects:
+                self.__unindex(key)
+                del self.__objects[key]
+            else:
+                self.__forget_related_ids(key.split(".", 1)[0])
+            name, id = key.split(".", 1)
+            if name in self.__ids:
+                ids = self.__ordered(name)
+                i = bisect_left(ids, id)
+                if i < len(ids) and ids[i] == id:
+                    del ids[i]
+        self.__encoded.pop(key, None)
+
+    def __ordered(self, name):
+        """returns the sorted list of ids of the objects of class name"""
+        with self.__cache:
+            ids = self.__ids.get(name)
+            if ids is None:
+                ids = [key[len(name) + 1:]
+                       for key in list(self.__classes.get(name, {}))]
+                ids.extend(key[len(name) + 1:]
+                           for key in list(self.__raw.get(name, ())))
+                ids.sort()
+                self.__ids[name] = ids
+            elif name in self.__unsorted:
+                ids.sort()
+            self.__unsorted.discard(name)
+            return ids
+
+    def __replay(self):
+        """applies the journal entries past __journal_offset to __objects
+        in order; a record torn by an interrupted append is skipped and
+        the next save() compacts, a last record still being written is
+        left for the next call"""
+        try:
+            with open(self.__journal_path, 'rb') as f:
+                f.seek(self.__journal_offset)
+                for size, entry in self.__format.entries(f):
+                    FileStorage.__journal_offset += size
+                    if entry is None:
+                        FileStorage.__torn = True
+                        continue
+                    FileStorage.__journal_size += 1
+                    self.__stale.add(entry["key"].split(".", 1)[0])
+                    if entry.get("deleted"):
+                        if self.__seen is not None:
+                            self.__seen.discard(entry["key"])
+                        if entry["key"] not in self.__keep:
+                            self.__pop(entry["key"])
+                    else:
+                        self.__load({entry["key"]: entry["value"]})
+        except FileNotFoundError:
+            pass
+
+    def __load(self, entries):
+        """stores the objects read from the files, a dictionary key ->
+        dictionary of the object or position of its record: as instances,
+        or as is in __raw in lazy or mapped mode except for the objects of
+        which an instance is in use"""
+        names = set()
+        for key, value in entries.items():
+            if self.__seen is not None:
+                self.__seen.add(key)
+            if key in self.__keep:
+                continue
+            if not (self.__lazy or self.__mapped) or key in self.__objects:
+                value = self.__decode(value)
+                self.__put(key, classes[value["__class__"]](**value))
+                continue
+            name = key.split(".", 1)[0]
+            names.add(name)
+            objs = self.__raw.get(name)
+            if objs is None:
+                objs = self.__raw[name] = {}
+            if key not in objs and name in self.__ids:
+                self.__ids[name].append(key[len(name) + 1:])
+                self.__unsorted.add(name)
+            objs[key] = value
+        for name in names:
+            for fk in relations.get(name, ()):
+                self.__raw_fks.pop((name, fk), None)
+            self.__forget_related_ids(name)
+            self.__where_ids.pop(name, None)
+
+    def __materialize(self, key):
+        """turns the dictionary stored under key in __raw into an
+        instance in __objects and returns it"""
+        with self.__cache:
+            obj = self.__objects.get(key)
+            if obj is not None:
+                return obj
+            value = self.__decode(self.__raw[key.split(".", 1)[0]][key])
+            obj = classes[value["__class__"]](**value)
+            self.__forget(key)
+            self.__objects[key] = obj
+            self.__index(key, obj)
+            return obj
+
+    def __forget(self, key):
+        """removes key from __raw, tells if it was there"""
+        name = key.split(".", 1)[0]
+        value = self.__raw.get(name, {}).pop(key, None)
+        if value is None:
+            return False
+        for fk in relations.get(name, ()):
+            if (name, fk) not in self.__raw_fks:
+                continue
+            value = self.__decode(value)
+            for fk_value in indexed_values(name, fk,
+                                           record_getter(name, value)):
+                keys = self.__raw_fks[(name, fk)].get(fk_value)
+                if keys is not None:
+                    keys.discard(key)
+        return True
+
+    def __forget_related_ids(self, name):
+        """drops the sorted ids of page() cached for the foreign keys of
+        class name, after objects of __raw, which the foreign key index
+        does not follow, were added, changed or removed"""
+        for cached in [cached for cached in list(self.__related_ids)
+                       if cached[0] == name]:
+            self.__related_ids.pop(cached, None)
+
+    def __raw_related(self, name, fk):
+        """returns the index value -> keys of the foreign key fk over the
+        objects of class name still in __raw"""
+        with self.__cache:
+            index = self.__raw_fks.get((name, fk))
+            if index is None:
+                index = {}
+                for key, value in self.__raw.get(name, {}).items():
+                    value = self.__decode(value)
+                    get = record_getter(name, value)
+                    for fk_value in indexed_values(name, fk, get):
+                        index.setdefault(fk_value, set()).add(key)
+                self.__raw_fks[(name, fk)] = index
+            return index
+
+    def __decode(self, value):
+        """returns the dictionary of an object in __raw, read from its
+        record when value is its position in a mapped file"""
+        if type(value) is tuple:
+            data, offset, length = value
+            value = self.__format.decode(data[offset:offset + length])[1]
+        return value
+
+    def __map(self, file_path):
+        """returns the dictionary key -> (map, offset, length) of the
+        records of file_path, mapped in memory, or None when it has no
+        index matching its current content"""
+        try:
+            with open(file_path + ".idx", 'r') as f:
+                index = json.load(f)
+            st = stat(file_path)
+            if index["stat"] != [st.st_ino, st.st_size, st.st_mtime_ns]:
+                return None
+            with open(file_path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, KeyError):
+            return None
+        return {key: (data, offset, length)
+                for key, (offset, length) in index["records"].items()}
+
+    def __read(self, file_path):
+        """loads the objects of the file file_path, if it exists"""
+        if self.__mapped:
+            entries = self.__map(file_path)
+            if entries is not None:
+                self.__load(entries)
+                return
+        try:
+            with open(file_path, 'rb') as f:
+                jo = self.__format.load(f)
+        except FileNotFoundError:
+            return
+        self.__load(jo)
+
+    def __write(self, file_path, objs, raws):
+        """writes to file_path the objects of the dictionary objs and the
+        dictionaries of the objects in the list raws"""
+        keys, records = [], []
+        for key, obj in objs.items():
+            cached = self.__encoded.get(key)
+            if cached is not None and cached[0] is obj and \
+                    key not in self.__dirty:
+                record = cached[1]
+            else:
+                obj_dict = obj.to_dict()
+                record = self.__format.encode(key, obj_dict)
+                # in-place changes to lists or dictionaries would not
+                # mark obj dirty
+                if not self.__encode_cache or any(
+                        type(v) in (list, dict) for v in obj_dict.values()):
+                    self.__encoded.pop(key, None)
+                else:
+                    self.__encoded[key] = (obj, record)
+            keys.append(key)
+            records.append(record)
+        for raw in raws:
+            for key, value in raw.items():
+                if type(value) is tuple:
+                    data, offset, length = value
+                    record = data[offset:offset + length]
+                else:
+                    record = self.__format.encode(key, value)
+                keys.append(key)
+                records.append(record)
+        offsets = self.__replace(
+            file_path, lambda f: self.__format.dump(f, records))
+        if self.__mapped:
+            st = stat(file_path)
+            index = {"stat": [st.st_ino, st.st_size, st.st_mtime_ns],
+                     "records": {key: [offset, len(record)] for key, offset,
+                                 record in zip(keys, offsets, records)}}
+            self.__replace(file_path + ".idx",
+                           lambda f: f.write(json.dumps(index).encode()))
+
+    @staticmethod
+    def __replace(file_path, dump):
+        """
+        Writes file_path without ever exposing a partial file: dump(f)
+        writes to a temporary file next to it, which is flushed to disk
+        and renamed over file_path; readers, mapped ones included, see the
+        old file or the new one. Returns what dump returns.
+        """
+        tmp = "{}.{}.{}.tmp".format(file_path, getpid(), get_ident())
+        try:
+            with open(tmp, 'wb') as f:
+                result = dump(f)
+                f.flush()
+                fsync(f.fileno())
+            replace(tmp, file_path)
+        except BaseException:
+            if path.exists(tmp):
+                remove(tmp)
+            raise
+        return result
+
+    @staticmethod
+    def __sync_dir(file_path):
+        """flushes to disk the directory entries of the directory of
+        file_path, so that renames and new files survive a crash"""
+        fd = os_open(path.dirname(path.abspath(file_path)), O_RDONLY)
+        try:
+            fsync(fd)
+        finally:
+            close(fd)
+
+    def __shard(self, name):
+        """returns the path of the file of class name in the sharded
+        layout, __file_path with the class name before its extension"""
+        root, ext = path.splitext(self.__file_path)
+        return "{}.{}{}".format(root, name, ext)
+
+    def __paths(self):
+        """returns the paths of the files holding the objects"""
+        if self.__sharded:
+            return [self.__shard(name) for name in classes]
+        return [self.__file_path]
+
+    def __signature(self):
+        """returns the (inode, size, mtime) of the files holding the
+        objects and of __journal_path, None for a missing file"""
+        stamps = []
+        for file_path in self.__paths() + [self.__journal_path]:
+            try:
+                st = stat(file_path)
+                stamps.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    @staticmethod
+    def __grew(old, new):
+        """tells if a file went from the signature old to new only by
+        having data appended to it"""
+        if new is None:
+            return old is None
+        return old is None or (old[0] == new[0] and old[1] <= new[1])
+
+    def __index(self, key, obj):
+        """adds obj to the class and foreign key indexes"""
+        name = obj.__class__.__name__
+        self.__classes.setdefault(name, {})[key] = obj
+        fks = {}
+        for fk in relations.get(name, ()):
+            values = indexed_values(name, fk,
+                                    lambda attr: getattr(obj, attr, None))
+            fks[fk] = values
+            for value in values:
+                self.__relations.setdefault((name, fk), {}).setdefault(
+                    value, {})[key] = obj
+                self.__related_ids.pop((name, fk, value), None)
+        self.__indexed_fks[key] = fks
+
+    def __unindex(self, key):
+        """removes the object stored under key from the indexes"""
+        obj = self.__objects.get(key)
+        if obj is None:
+            return
+        name = obj.__class__.__name__
+        self.__classes.get(name, {}).pop(key, None)
+        for fk, values in self.__indexed_fks.pop(key, {}).items():
+            bucket = self.__relations.get((name, fk), {})
+            for value in values:
+                bucket.get(value, {}).pop(key, None)
+                self.__related_ids.pop((name, fk, value), None)
+                if value in bucket and not bucket[value]:
+                    del bucket[value]
+
+    def __sync(self):
+        """rebuilds the indexes when __objects was replaced or resized
+        without going through new() and delete()"""
+        if self.__synced():
+            return
+        with self.__cache:
+            if not self.__synced():
+                self.__rebuild()
+
+    @staticmethod
+    def __synced():
+        """tells if the indexes match __objects"""
+        size = sum(len(objs) for objs in list(FileStorage.__classes.values()))
+        return (FileStorage.__indexed is FileStorage.__objects and
+                size == len(FileStorage.__objects))
+
+    def __rebuild(self):
+        """rebuilds the indexes from __objects"""
+        if FileStorage.__indexed is not FileStorage.__objects:
+            FileStorage.__raw = {}
+            FileStorage.__raw_fks = {}
+        if FileStorage.__indexed is not None or FileStorage.__objects:
+            # changed behind new() and delete(): rewrite every shard
+            FileStorage.__stale = set(classes)
+        FileStorage.__classes = {}
+        FileStorage.__relations = {}
+        FileStorage.__related_ids = {}
+        FileStorage.__where_ids = {}
+        FileStorage.__indexed_fks = {}
+        FileStorage.__encoded = {}
+        FileStorage.__ids = {}
+        FileStorage.__unsorted = set()
+        FileStorage.__indexed = FileStorage.__objects
+        for key, obj in FileStorage.__objects.items():
+            self.__index(key, obj)
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+"""
+Contains the geometry of the location queries on Place: the grid of
+cells FileStorage indexes places on, the bounding box of a circle on the
+Earth, and great-circle distances, computed for a whole candidate set at
+once with numpy when it is installed.
+
+A box is a tuple (south, west, north, east) in degrees; west is greater
+than east for a box crossing the antimeridian.
+"""
+
+from math import asin, cos, degrees, floor, radians, sin, sqrt
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# float - mean radius of the Earth, in kilometers
+EARTH_RADIUS = 6371.0088
+# float - side of a grid cell, in degrees: about 11 km at the equator
+GRID = 0.1
+# int - number of cells around a parallel
+COLUMNS = round(360 / GRID)
+
+
+def cell(lat, lng):
+    """returns the grid cell (row, column) of a point"""
+    return (floor((lat + 90) / GRID),
+            floor((lng + 180) / GRID) % COLUMNS)
+
+
+def cells(box):
+    """returns the number of grid cells covering box and an iterator over
+    them"""
+    south, west, north, east = box
+    rows = range(cell(south, 0)[0], cell(north, 0)[0] + 1)
+    first, last = cell(0, west)[1], cell(0, east)[1]
+    if west <= east and east - west >= 360 - GRID:
+        columns = range(COLUMNS)
+    elif west > east or last < first:
+        columns = list(range(first, COLUMNS)) + list(range(0, last + 1))
+    else:
+        columns = range(first, last + 1)
+    return len(rows) * len(columns), ((row, column) for row in rows
+                                      for column in columns)
+
+
+def circle_box(lat, lng, radius):
+    """returns the bounding box of the points within radius km of a
+    point; it spans every longitude when the circle reaches a pole"""
+    span = degrees(radius / EARTH_RADIUS)
+    south, north = max(lat - span, -90.0), min(lat + span, 90.0)
+    if south == -90.0 or north == 90.0 or span >= 90:
+        return south, -180.0, north, 180.0
+    lng_span = degrees(asin(min(1.0, sin(radians(span)) /
+                                cos(radians(lat)))))
+    if lng_span >= 180:
+        return south, -180.0, north, 180.0
+    west = (lng - lng_span + 180) % 360 - 180
+    east = (lng + lng_span + 180) % 360 - 180
+    return south, west, north, east
+
+
+def inside(box, lat, lng):
+    """tells if a point is in box"""
+    south, west, north, east = box
+    if not south <= lat <= north:
+        return False
+    if west <= east:
+        return west <= lng <= east
+    return lng >= west or lng <= east
+
+
+def distances(lat, lng, points):
+    """returns the haversine distances in km from a point to a list of
+    (lat, lng) points, as one vector operation with numpy"""
+    if numpy is not None and points:
+        lats, lngs = numpy.radians(numpy.array(points, dtype=float)).T
+        lat, lng = radians(lat), radians(lng)
+        h = numpy.sin((lats - lat) / 2) ** 2 + numpy.cos(lat) * \
+            numpy.cos(lats) * numpy.sin((lngs - lng) / 2) ** 2
+        return (2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(
+            numpy.minimum(h, 1.0)))).tolist()
+    lat, lng = radians(lat), radians(lng)
+    result = []
+    for p_lat, p_lng in points:
+        p_lat, p_lng = radians(p_lat), radians(p_lng)
+        h = sin((p_lat - lat) / 2) ** 2 + cos(lat) * cos(p_lat) * \
+            sin((p_lng - lng) / 2) ** 2
+        result.append(2 * EARTH_RADIUS * asin(sqrt(min(h, 1.0))))
+    return result
+
+
+def nearest(lat, lng, places, radius=None, box=None, limit=None):
+    """
+    Returns the list of (place, distance in km) of the places, sorted by
+    distance from a point, keeping those within radius km and in box
+    and then the first limit ones. Places without a location are left
+    out.
+    """
+    places = [place for place in places
+              if place.latitude is not None and
+              place.longitude is not None and
+              (box is None or inside(box, place.latitude, place.longitude))]
+    found = zip(places, distances(lat, lng, [(place.latitude,
+                                              place.longitude)
+                                             for place in places]))
+    if radius is not None:
+        found = [(place, km) for place, km in found if km <= radius]
+    found = sorted(found, key=lambda item: (item[1], item[0].id))
+    return found[:limit]
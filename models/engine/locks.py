@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+"""
+Contains the locks guarding the storage engines
+"""
+
+from contextlib import contextmanager
+from threading import Condition, get_ident, local
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class RWLock:
+    """
+    Readers-writer lock: any number of threads read at once, a writer
+    holds the lock alone. Once a writer waits no new reader gets in, so
+    writers are not starved. A thread holding the lock can take it again
+    (reads inside a read or a write, writes inside a write), but cannot
+    turn a read into a write.
+    """
+
+    def __init__(self):
+        """creates an unlocked lock"""
+        self.__cond = Condition()
+        # int - number of threads reading
+        self.__readers = 0
+        # int - number of threads waiting to write
+        self.__waiting = 0
+        # thread identifier of the writer, None when nobody writes
+        self.__writer = None
+        # per thread depth of nested reads
+        self.__local = local()
+
+    @contextmanager
+    def read(self):
+        """holds the lock shared for the duration of a with block"""
+        reads = getattr(self.__local, "reads", 0)
+        if reads or self.__writer == get_ident():
+            self.__local.reads = reads + 1
+            try:
+                yield
+            finally:
+                self.__local.reads = reads
+            return
+        with self.__cond:
+            while self.__writer is not None or self.__waiting:
+                self.__cond.wait()
+            self.__readers += 1
+        self.__local.reads = 1
+        try:
+            yield
+        finally:
+            self.__local.reads = 0
+            with self.__cond:
+                self.__readers -= 1
+                if not self.__readers:
+                    self.__cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        """holds the lock exclusively for the duration of a with block"""
+        me = get_ident()
+        if self.__writer == me:
+            yield
+            return
+        if getattr(self.__local, "reads", 0):
+            raise RuntimeError("cannot write while holding a read lock")
+        with self.__cond:
+            self.__waiting += 1
+            try:
+                while self.__writer is not None or self.__readers:
+                    self.__cond.wait()
+            finally:
+                self.__waiting -= 1
+            self.__writer = me
+        try:
+            yield
+        finally:
+            with self.__cond:
+                self.__writer = None
+                self.__cond.notify_all()
+
+
+@contextmanager
+def file_lock(file_path, shared=False):
+    """
+    Holds an advisory lock on file_path, created if needed, for the
+    duration of a with block: shared between readers or exclusive, and
+    only between processes that lock the same file. Yields the file open
+    for appending. Nothing is locked where fcntl is missing (Windows).
+    """
+    with open(file_path, 'ab') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else
+                        fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
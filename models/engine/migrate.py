@@ -0,0 +1,37 @@
+#!/usr/bin/python3
+"""
+Converts the FileStorage files between the single file layout (file.json)
+and the sharded one (one file per class: file.State.json ...), or between
+the file formats (json, binary, msgpack).
+
+    python3 -m models.engine.migrate shards
+    python3 -m models.engine.migrate file
+    python3 -m models.engine.migrate binary
+
+The objects are read from the other layout, or in the current format,
+journal included, and the old files are removed once the new ones are
+written. Set HBNB_FILE_SHARDED=1 or HBNB_FILE_FORMAT afterwards to run on
+the new files.
+"""
+import argparse
+from models.engine.file_storage import FileStorage
+from models.engine.serializers import formats
+
+
+def main():
+    """parses the command line and converts the files"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("target", choices=("shards", "file") +
+                        tuple(formats),
+                        help="layout or format to convert the files to")
+    args = parser.parse_args()
+    storage = FileStorage()
+    if args.target in formats:
+        storage.migrate(fmt=args.target)
+    else:
+        storage.migrate(args.target == "shards")
+    print("{} objects written".format(storage.count()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+"""
+Contains the file formats FileStorage reads and writes, selected by
+HBNB_FILE_FORMAT: json (the default), binary, or msgpack when the msgpack
+package is installed.
+
+A format turns the to_dict() of an object into a record of a data file,
+whole data files or single records back into dictionaries, and journal
+entries into records that can be appended to the journal and read back
+one by one.
+"""
+
+import json
+import marshal
+import struct
+from zlib import crc32
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class JSONSerializer:
+    """one JSON object per data file, one JSON line per journal entry"""
+
+    extension = ".json"
+
+    def encode(self, key, value):
+        """returns the record of the dictionary value stored under key"""
+        return (json.dumps(key) + ": " + json.dumps(value)).encode()
+
+    def dump(self, f, records):
+        """writes the records to the binary file f, returns the offset of
+        each record in the file"""
+        f.write(b"{" + b", ".join(records) + b"}")
+        offsets = []
+        offset = 1
+        for record in records:
+            offsets.append(offset)
+            offset += len(record) + 2
+        return offsets
+
+    def load(self, f):
+        """returns the dictionary key -> value of the binary file f"""
+        return json.loads(f.read())
+
+    def decode(self, record):
+        """returns the (key, value) of a record of a data file"""
+        return next(iter(json.loads(b"{" + record + b"}").items()))
+
+    def entry(self, entry):
+        """returns the journal record of the dictionary entry"""
+        return json.dumps(entry).encode() + b"\n"
+
+    def entries(self, f):
+        """yields (size, entry) for the complete journal records of the
+        binary file f, entry being None for a record that cannot be read"""
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = None
+            yield len(line), entry
+
+
+class BinarySerializer:
+    """
+    Length-prefixed records: a big-endian size and CRC-32 followed by the
+    marshal encoding of (key, value) in data files, or of the entry in
+    the journal. Data files start with a header naming the format.
+    """
+
+    extension = ".bin"
+    header = b"HBNB marshal 4\n"
+    prefix = struct.Struct(">II")
+
+    def pack(self, value):
+        """returns the bytes of value"""
+        return marshal.dumps(value, 4)
+
+    def unpack(self, data):
+        """returns the value of the bytes data"""
+        return marshal.loads(data)
+
+    def record(self, value):
+        """returns value packed behind its size and checksum"""
+        data = self.pack(value)
+        return self.prefix.pack(len(data), crc32(data)) + data
+
+    def encode(self, key, value):
+        """returns the record of the dictionary value stored under key"""
+        return self.record((key, value))
+
+    def dump(self, f, records):
+        """writes the header then the records to the binary file f,
+        returns the offset of each record in the file"""
+        f.write(self.header + b"".join(records))
+        offsets = []
+        offset = len(self.header)
+        for record in records:
+            offsets.append(offset)
+            offset += len(record)
+        return offsets
+
+    def load(self, f):
+        """returns the dictionary key -> value of the binary file f"""
+        data = f.read()
+        if not data.startswith(self.header):
+            raise ValueError("not a {} file".format(self.header.strip()))
+        objects = {}
+        offset = len(self.header)
+        size = self.prefix.size
+        while offset < len(data):
+            length, crc = self.prefix.unpack_from(data, offset)
+            offset += size
+            chunk = data[offset:offset + length]
+            if len(chunk) != length or crc32(chunk) != crc:
+                raise ValueError("truncated or corrupted record")
+            key, value = self.unpack(chunk)
+            objects[key] = value
+            offset += length
+        return objects
+
+    def decode(self, record):
+        """returns the (key, value) of a record of a data file"""
+        key, value = self.unpack(record[self.prefix.size:])
+        return key, value
+
+    def entry(self, entry):
+        """returns the journal record of the dictionary entry"""
+        return self.record(entry)
+
+    def entries(self, f):
+        """yields (size, entry) for the complete journal records of the
+        binary file f, entry being None for a record that cannot be read"""
+        size = self.prefix.size
+        while True:
+            prefix = f.read(size)
+            if len(prefix) < size:
+                return
+            length, crc = self.prefix.unpack(prefix)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            entry = None
+            if crc32(data) == crc:
+                try:
+                    entry = self.unpack(data)
+                except (ValueError, EOFError, TypeError):
+                    pass
+            yield size + length, entry
+
+
+class MsgpackSerializer(BinarySerializer):
+    """the length-prefixed records of BinarySerializer, packed with
+    msgpack instead of marshal"""
+
+    extension = ".msgpack"
+    header = b"HBNB msgpack 1\n"
+
+    def __init__(self):
+        """checks that msgpack is installed"""
+        if msgpack is None:
+            raise ImportError("HBNB_FILE_FORMAT=msgpack needs the "
+                              "msgpack package")
+
+    def pack(self, value):
+        """returns the bytes of value"""
+        return msgpack.packb(value, use_bin_type=True)
+
+    def unpack(self, data):
+        """returns the value of the bytes data"""
+        return msgpack.unpackb(data, raw=False)
+
+
+formats = {"json": JSONSerializer, "binary": BinarySerializer,
+           "msgpack": MsgpackSerializer}
@@ -5,6 +5,7 @@ from models.base_model import BaseModel, Base
 from os import getenv
 import sqlalchemy
 from sqlalchemy import Column, String, Integer, Float, ForeignKey, Table
+from sqlalchemy import Index
 from sqlalchemy.orm import relationship
 
 if models.storage_t == 'db':
@@ -16,14 +17,16 @@ if models.storage_t == 'db':
                           Column('amenity_id', String(60),
                                  ForeignKey('amenities.id', onupdate='CASCADE',
                                             ondelete='CASCADE'),
-                                 primary_key=True))
+                                 primary_key=True, index=True))
 
 
 class Place(BaseModel, Base):
     """Representation of Place """
     if models.storage_t == 'db':
         __tablename__ = 'places'
-        city_id = Column(String(60), ForeignKey('cities.id'), nullable=False)
+        __table_args__ = (Index('places_location', 'latitude', 'longitude'),)
+        city_id = Column(String(60), ForeignKey('cities.id'), nullable=False,
+                         index=True)
         user_id = Column(String(60), ForeignKey('users.id'), nullable=False)
         name = Column(String(128), nullable=False)
         description = Column(String(1024), nullable=True)
@@ -59,20 +62,16 @@ class Place(BaseModel, Base):
         def reviews(self):
             """getter attribute returns the list of Review instances"""
             from models.review import Review
-            review_list = []
-            all_reviews = models.storage.all(Review)
-            for review in all_reviews.values():
-                if review.place_id == self.id:
-                    review_list.append(review)
-            return review_list
+            return list(models.storage.related(Review, "place_id",
+                                               self.id).values())
 
         @property
         def amenities(self):
             """getter attribute returns the list of Amenity instances"""
             from models.amenity import Amenity
             amenity_list = []
-            all_amenities = models.storage.all(Amenity)
-            for amenity in all_amenities.values():
-                if amenity.place_id == self.id:
+            for amenity_id in self.amenity_ids:
+                amenity = models.storage.get(Amenity, amenity_id)
+                if amenity is not None:
                     amenity_list.append(amenity)
             return amenity_list
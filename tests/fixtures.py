@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+"""
+Contains the FileStorageTestCase class, the fixture of the tests run on
+a FileStorage of their own
+"""
+
+from models.engine import file_storage
+import os
+import shutil
+import tempfile
+import unittest
+
+FileStorage = file_storage.FileStorage
+
+
+class FileStorageTestCase(unittest.TestCase):
+    """Runs each test on a FileStorage of its own, every mode off, inside
+    a temporary directory"""
+    state = ("objects", "dirty", "encoded", "encode_cache", "stale",
+             "file_path", "journal_path", "journal", "journal_size",
+             "journal_offset", "torn", "stamp", "generation", "lazy",
+             "mapped", "sharded", "shared", "format", "window", "behind",
+             "behind_max", "pending_since")
+
+    def setUp(self):
+        """points FileStorage to an empty file.json in a temporary
+        directory, made the working directory, with every mode off"""
+        self.saved = {k: getattr(FileStorage, "_FileStorage__" + k)
+                      for k in self.state}
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        FileStorage._FileStorage__objects = {}
+        FileStorage._FileStorage__dirty = set()
+        FileStorage._FileStorage__file_path = "file.json"
+        FileStorage._FileStorage__journal_path = "file.json.journal"
+        FileStorage._FileStorage__stamp = None
+        FileStorage._FileStorage__pending_since = None
+        for k in ("journal", "torn", "lazy", "mapped", "sharded", "shared"):
+            setattr(FileStorage, "_FileStorage__" + k, False)
+        FileStorage._FileStorage__format = file_storage.formats["json"]()
+        FileStorage._FileStorage__window = 0
+        FileStorage._FileStorage__behind = 0
+
+    def tearDown(self):
+        """restores FileStorage and removes the temporary directory"""
+        for k, v in self.saved.items():
+            setattr(FileStorage, "_FileStorage__" + k, v)
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
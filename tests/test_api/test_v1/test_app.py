@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+"""
+Contains the TestAppThreads, TestAppBatch, TestAppQuery, TestAppSearch
+and TestAppNear classes
+"""
+
+from flask import jsonify
+import models
+from models import storage
+from models.engine.file_storage import FileStorage
+from models.place import Place
+from models.state import State
+import pep8
+from tests.fixtures import FileStorageTestCase
+import threading
+import unittest
+from unittest import mock
+
+
+class TestAppDocs(unittest.TestCase):
+    """Tests to check the style of the API tests"""
+    def test_pep8_conformance_test_app(self):
+        """Test tests/test_api/test_v1/test_app.py conforms to PEP8."""
+        pep8s = pep8.StyleGuide(quiet=True)
+        result = pep8s.check_files(['tests/test_api/test_v1/test_app.py'])
+        self.assertEqual(result.total_errors, 0,
+                         "Found code style errors (and warnings).")
+
+
+class AppTestCase(FileStorageTestCase):
+    """Runs the API against a FileStorage of its own"""
+
+    def setUp(self):
+        """points FileStorage to an empty file of its own"""
+        from api.v1.app import app
+        super().setUp()
+        self.client = app.test_client()
+
+
+@unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+class TestAppThreads(AppTestCase):
+    """Stress tests of the API served by several threads at once"""
+    threads = 8
+    calls = 25
+
+    def test_concurrent_requests(self):
+        """Test that concurrent POST, PUT and GET requests lose no write
+        and see no half-updated storage"""
+        errors = []
+
+        def work(n):
+            """creates, renames and lists states"""
+            try:
+                for i in range(self.calls):
+                    name = "{}-{}".format(n, i)
+                    r = self.client.post("/api/v1/states",
+                                         json={"name": name})
+                    self.assertEqual(r.status_code, 201)
+                    state_id = r.get_json()["id"]
+                    r = self.client.put("/api/v1/states/" + state_id,
+                                        json={"name": name + "!"})
+                    self.assertEqual(r.status_code, 200)
+                    r = self.client.get("/api/v1/states")
+                    self.assertEqual(r.status_code, 200)
+                    self.assertTrue(r.get_json())
+                    r = self.client.get("/api/v1/stats")
+                    self.assertEqual(r.status_code, 200)
+            except Exception as e:
+                errors.append(e)
+        workers = [threading.Thread(target=work, args=(n,))
+                   for n in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        total = self.threads * self.calls
+        self.assertEqual(storage.count(State), total)
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        states = storage.all(State).values()
+        self.assertEqual(len(states), total)
+        self.assertTrue(all(s.name.endswith("!") for s in states))
+
+
+@unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+class TestAppBatch(AppTestCase):
+    """Tests of the batch endpoints"""
+
+    def test_batch(self):
+        """Test that a batch creates or updates all its objects or, when
+        an item is invalid, none"""
+        r = self.client.post("/api/v1/states/batch",
+                             json=[{"name": str(i)} for i in range(20)])
+        self.assertEqual(r.status_code, 201)
+        states = r.get_json()
+        self.assertEqual(len(states), 20)
+        self.assertEqual(storage.count(State), 20)
+        r = self.client.post("/api/v1/states/batch", json={"name": "x"})
+        self.assertEqual(r.status_code, 400)
+        r = self.client.post("/api/v1/states/batch",
+                             json=[{"name": "x"}, {}])
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(storage.count(State), 20)
+        r = self.client.post("/api/v1/states/{}/cities/batch".format(
+            states[0]["id"]), json=[{"name": "a"}, {"name": "b"}])
+        self.assertEqual(r.status_code, 201)
+        self.assertTrue(all(c["state_id"] == states[0]["id"]
+                            for c in r.get_json()))
+        r = self.client.post("/api/v1/states/nope/cities/batch",
+                             json=[{"name": "a"}])
+        self.assertEqual(r.status_code, 404)
+        r = self.client.put("/api/v1/states/batch",
+                            json=[{"id": s["id"], "name": "new"}
+                                  for s in states[:5]] +
+                            [{"id": "nope", "name": "new"}])
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.get_json(), {"updated": 5})
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        names = [s.name for s in storage.all(State).values()]
+        self.assertEqual(names.count("new"), 5)
+
+
+@unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+class TestAppQuery(AppTestCase):
+    """Tests of the filter and sort parameters of the collections"""
+
+    def test_filter_and_sort(self):
+        """Test that field=value filters and sort sorts the listings"""
+        names = ["b", "a", "c", "a"]
+        self.client.post("/api/v1/states/batch",
+                         json=[{"name": name} for name in names])
+        r = self.client.get("/api/v1/states?name=a")
+        self.assertEqual([s["name"] for s in r.get_json()], ["a", "a"])
+        r = self.client.get("/api/v1/states?sort=-name&limit=3")
+        self.assertEqual([s["name"] for s in r.get_json()], ["c", "b", "a"])
+        r = self.client.get("/api/v1/states?name=a&limit=1")
+        self.assertEqual(len(r.get_json()), 1)
+        self.assertIn("name=a", r.headers["Link"])
+        for query in ("nope=1", "sort=nope", "sort=name&after=x",
+                      "created_at=x"):
+            r = self.client.get("/api/v1/states?" + query)
+            self.assertEqual(r.status_code, 400, query)
+
+    def test_created_at_cursor(self):
+        """Test that sort=created_at pages with a (created_at, id)
+        cursor, ties in id order"""
+        times = ["2017-03-25T19:42:4{}.000000".format(i % 3)
+                 for i in range(7)]
+        states = [State(name=str(i), created_at=t)
+                  for i, t in enumerate(times)]
+        storage.bulk_new(states)
+        expected = [s.id for s in sorted(states,
+                                         key=lambda s: (s.created_at, s.id))]
+        url, ids = "/api/v1/states?sort=created_at&limit=3", []
+        while url:
+            r = self.client.get(url)
+            self.assertEqual(r.status_code, 200)
+            ids += [s["id"] for s in r.get_json()]
+            link = r.headers.get("Link")
+            url = link[1:link.index(">")] if link else None
+        self.assertEqual(ids, expected)
+        r = self.client.get("/api/v1/states?sort=created_at")
+        self.assertEqual([s["id"] for s in r.get_json()], expected)
+        r = self.client.get("/api/v1/states?sort=created_at&after=x")
+        self.assertEqual(r.status_code, 400)
+
+    def test_stream_matches_jsonify(self):
+        """Test that a streamed listing, over several pages, is the body
+        jsonify() returns for the same list"""
+        from api.v1.app import app
+        from api.v1.views import pagination
+        states = [State(name="é{}".format(i), zone={"b": 1, "a": 2})
+                  for i in range(5)]
+        storage.bulk_new(states)
+        with mock.patch.object(pagination, "STREAM_BATCH", 2):
+            r = self.client.get("/api/v1/states")
+        self.assertEqual(r.status_code, 200)
+        with app.app_context():
+            expected = jsonify([s.to_dict() for s in
+                                sorted(states, key=lambda s: s.id)])
+        self.assertEqual(r.get_data(), expected.get_data())
+
+
+@unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+class TestAppSearch(AppTestCase):
+    """Tests of the places_search endpoint"""
+
+    def test_places_search(self):
+        """Test that places_search filters on states, cities and
+        amenities linked through the API"""
+        def post(url, json=None):
+            r = self.client.post("/api/v1/" + url, json=json)
+            self.assertIn(r.status_code, (200, 201), url)
+            return r.get_json()
+        user = post("users", {"email": "a", "password": "b"})
+        state = post("states", {"name": "A"})
+        city = post("states/{}/cities".format(state["id"]), {"name": "c"})
+        wifi = post("amenities", {"name": "wifi"})
+        places = post("cities/{}/places/batch".format(city["id"]),
+                      [{"user_id": user["id"], "name": str(i)}
+                       for i in range(3)])
+        post("places/{}/amenities/{}".format(places[1]["id"], wifi["id"]))
+
+        def search(body):
+            r = self.client.post("/api/v1/places_search", json=body)
+            self.assertEqual(r.status_code, 200)
+            return [place["name"] for place in r.get_json()]
+        self.assertEqual(len(search({})), 3)
+        self.assertEqual(len(search({"states": [state["id"]]})), 3)
+        self.assertEqual(search({"cities": ["nope"]}), [])
+        self.assertEqual(search({"states": [state["id"]],
+                                 "amenities": [wifi["id"]]}), ["1"])
+        r = self.client.delete("/api/v1/places/{}/amenities/{}".format(
+            places[1]["id"], wifi["id"]))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(search({"amenities": [wifi["id"]]}), [])
+        r = self.client.post("/api/v1/places_search", json={"cities": "x"})
+        self.assertEqual(r.status_code, 400)
+
+
+@unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+class TestAppNear(AppTestCase):
+    """Tests of the places/near endpoint"""
+
+    def test_places_near(self):
+        """Test that places/near lists the places around a point or in a
+        box, nearest first, with their distance"""
+        for name, lat, lng in (("paris", 48.8566, 2.3522),
+                               ("lyon", 45.764, 4.8357),
+                               ("versailles", 48.8049, 2.1204)):
+            storage.new(Place(name=name, latitude=lat, longitude=lng))
+
+        def near(query):
+            r = self.client.get("/api/v1/places/near?" + query)
+            self.assertEqual(r.status_code, 200, query)
+            return [(p["name"], round(p["distance"])) for p in r.get_json()]
+        self.assertEqual(near("lat=48.86&lng=2.35&radius=25"),
+                         [("paris", 0), ("versailles", 18)])
+        self.assertEqual(near("lat=48.86&lng=2.35&radius=500&limit=2"),
+                         [("paris", 0), ("versailles", 18)])
+        self.assertEqual([p for p, km in near(
+            "south=45&west=2&north=49&east=5&lat=45.76&lng=4.84")],
+            ["lyon", "paris", "versailles"])
+        for query in ("lat=1&lng=2", "lat=x&lng=2&radius=1",
+                      "lat=91&lng=2&radius=1", "south=1&west=2&north=3",
+                      "lat=1&lng=2&radius=1&limit=0",
+                      "lat=nan&lng=2&radius=1", "lat=1&lng=inf&radius=1",
+                      "lat=1&lng=2&radius=nan", "lat=1&lng=2&radius=inf",
+                      "south=nan&west=2&north=3&east=4",
+                      "south=1&west=inf&north=3&east=4",
+                      "south=1&west=2&north=-inf&east=4",
+                      "south=1&west=2&north=3&east=nan",
+                      "south=-91&west=2&north=3&east=4",
+                      "south=1&west=2&north=91&east=4",
+                      "south=1&west=-181&north=3&east=4",
+                      "south=1&west=2&north=3&east=181"):
+            r = self.client.get("/api/v1/places/near?" + query)
+            self.assertEqual(r.status_code, 400, query)
@@ -158,3 +158,27 @@ class TestBaseModel(unittest.TestCase):
         self.assertEqual(old_created_at, new_created_at)
         self.assertTrue(mock_storage.new.called)
         self.assertTrue(mock_storage.save.called)
+
+    def test_time_helpers_match_time_format(self):
+        """Test that parse_time and format_time agree with strptime and
+        strftime on the `time` format"""
+        t_format = "%Y-%m-%dT%H:%M:%S.%f"
+        for value in [datetime(2017, 9, 28, 9, 50, 46, 772167),
+                      datetime(2024, 1, 1), datetime(1999, 12, 31, 23, 59)]:
+            with self.subTest(value=value):
+                string = value.strftime(t_format)
+                self.assertEqual(models.base_model.format_time(value),
+                                 string)
+                self.assertEqual(models.base_model.parse_time(string),
+                                 value)
+
+    @unittest.skipIf(not models.base_model.lazy, "not testing lazy mode")
+    def test_lazy_timestamps(self):
+        """Test that timestamps read from a dict stay strings until used"""
+        string = "2017-09-28T09:50:46.772167"
+        inst = BaseModel(created_at=string, updated_at=string)
+        self.assertEqual(inst.__dict__["created_at"], string)
+        self.assertEqual(inst.to_dict()["created_at"], string)
+        self.assertEqual(inst.created_at,
+                         datetime(2017, 9, 28, 9, 50, 46, 772167))
+        self.assertIs(type(inst.__dict__["created_at"]), datetime)
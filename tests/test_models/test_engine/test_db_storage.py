@@ -18,7 +18,10 @@ from models.user import User
 import json
 import os
 import pep8
+from sqlalchemy import event
+import time
 import unittest
+from unittest import mock
 
 
 DBStorage = db_storage.DBStorage
@@ -129,3 +132,186 @@ class TestFileStorage(unittest.TestCase):
         """Test count when cls is passed"""
         objs = len(storage.all(State).values())
         self.assertEqual(storage.count(State), objs)
+
+    def test_pool_settings(self):
+        """Test that the HBNB_MYSQL_POOL_* settings reach the engine pool"""
+        env = {"HBNB_DB_URL": "sqlite:///test_pool.db",
+               "HBNB_MYSQL_POOL_SIZE": "3", "HBNB_MYSQL_MAX_OVERFLOW": "2",
+               "HBNB_MYSQL_POOL_TIMEOUT": "1.5",
+               "HBNB_MYSQL_POOL_RECYCLE": "600",
+               "HBNB_MYSQL_POOL_PRE_PING": "1", "HBNB_ENV": ""}
+        with mock.patch.dict(os.environ, env):
+            storage = db_storage.DBStorage()
+        engine = storage._DBStorage__engine
+        pool = engine.pool
+        self.assertIsInstance(pool, db_storage.TimedQueuePool)
+        self.assertEqual(pool.size(), 3)
+        self.assertEqual(pool._max_overflow, 2)
+        self.assertEqual(pool._timeout, 1.5)
+        self.assertEqual(pool._recycle, 600)
+        self.assertTrue(pool._pre_ping)
+        with engine.connect():
+            self.assertEqual(pool.checkedout(), 1)
+            with mock.patch.object(storage, "dirty", return_value=set()):
+                metrics = storage.metrics()
+            self.assertEqual(metrics["pool"]["overflow"], 0)
+        self.assertEqual(pool.waits, 1)
+        engine.dispose()
+        if os.path.exists("test_pool.db"):
+            os.remove("test_pool.db")
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_bulk_new_and_update(self):
+        """Test that bulk_new() and bulk_update() batch their statements"""
+        env = {"HBNB_DB_URL": "sqlite:///test_bulk.db", "HBNB_ENV": ""}
+        with mock.patch.dict(os.environ, env):
+            storage = db_storage.DBStorage()
+            storage.reload()
+        engine = storage._DBStorage__engine
+        statements = []
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def record(conn, cursor, statement, params, context, many):
+            if statement.split()[0] in ("INSERT", "UPDATE"):
+                statements.append((statement.split()[0], many))
+        try:
+            states = [State(name=str(i)) for i in range(50)]
+            storage.bulk_new(states)
+            self.assertEqual(statements, [("INSERT", True)])
+            self.assertEqual(storage.count(State), 50)
+            rows = [{"id": s.id, "name": "x", "bogus": 1}
+                    for s in states[:10]] + [{"id": "nope", "name": "y"}]
+            self.assertEqual(storage.bulk_update(State, rows), 10)
+            self.assertEqual(statements[1:], [("UPDATE", True)])
+            self.assertEqual(storage.get(State, states[0].id).name, "x")
+            self.assertEqual(storage.get(State, states[10].id).name, "10")
+        finally:
+            storage.close()
+            engine.dispose()
+            if os.path.exists("test_bulk.db"):
+                os.remove("test_bulk.db")
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_count_counters(self):
+        """Test that count() reads the tables once, then follows new() and
+        delete(), and reads them again after HBNB_MYSQL_COUNT_TTL"""
+        env = {"HBNB_DB_URL": "sqlite:///test_count.db", "HBNB_ENV": ""}
+        with mock.patch.dict(os.environ, env):
+            storage = db_storage.DBStorage()
+            storage.reload()
+        engine = storage._DBStorage__engine
+        counts = []
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def record(conn, cursor, statement, params, context, many):
+            if "count(" in statement.lower():
+                counts.append(statement)
+        try:
+            states = [State(name=str(i)) for i in range(3)]
+            storage.bulk_new(states)
+            self.assertEqual(storage.count(State), 3)
+            storage.delete(states[0])
+            storage.new(City(name="C", state_id=states[1].id))
+            storage.save()
+            self.assertEqual(storage.count(State), 2)
+            self.assertEqual(storage.count(), 3)
+            self.assertEqual(len(counts), 1)
+            with engine.begin() as conn:
+                conn.execute(State.__table__.delete())
+            self.assertEqual(storage.count(State), 2)
+            storage._DBStorage__count_ttl = 0
+            time.sleep(0.01)
+            self.assertEqual(storage.count(State), 0)
+            self.assertEqual(len(counts), 2)
+        finally:
+            storage.close()
+            engine.dispose()
+            if os.path.exists("test_count.db"):
+                os.remove("test_count.db")
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_page_created_at(self):
+        """Test that page() walks the objects in (created_at, id) order
+        from a cursor"""
+        env = {"HBNB_DB_URL": "sqlite:///test_page.db", "HBNB_ENV": ""}
+        with mock.patch.dict(os.environ, env):
+            storage = db_storage.DBStorage()
+            storage.reload()
+        engine = storage._DBStorage__engine
+        try:
+            states = [State(name=str(i),
+                            created_at=datetime(2017, 3, 25, 0, 0, i % 3))
+                      for i in range(7)]
+            storage.bulk_new(states)
+            expected = [s.id for s in sorted(
+                states, key=lambda s: (s.created_at, s.id))]
+            ids, after = [], None
+            while True:
+                objs = list(storage.page(State, 3, after,
+                                         by="created_at").values())
+                ids += [s.id for s in objs]
+                if len(objs) < 3:
+                    break
+                after = (objs[-1].created_at, objs[-1].id)
+            self.assertEqual(ids, expected)
+            with self.assertRaises(ValueError):
+                storage.page(State, 3, by="name")
+        finally:
+            storage.close()
+            engine.dispose()
+            if os.path.exists("test_page.db"):
+                os.remove("test_page.db")
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_all_where_order_by_limit(self):
+        """Test that all() filters, sorts and limits in SQL"""
+        env = {"HBNB_DB_URL": "sqlite:///test_query.db", "HBNB_ENV": ""}
+        with mock.patch.dict(os.environ, env):
+            storage = db_storage.DBStorage()
+            storage.reload()
+        engine = storage._DBStorage__engine
+        try:
+            states = [State(name=name) for name in ("b", "a", "c", "a")]
+            storage.bulk_new(states)
+            objs = storage.all(State, where={"name": "a"})
+            self.assertEqual(len(objs), 2)
+            objs = storage.all(State, order_by="-name", limit=3)
+            self.assertEqual([s.name for s in objs.values()],
+                             ["c", "b", "a"])
+            with self.assertRaises(ValueError):
+                storage.all(order_by="name")
+        finally:
+            storage.close()
+            engine.dispose()
+            if os.path.exists("test_query.db"):
+                os.remove("test_query.db")
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_places_near(self):
+        """Test that places_near() filters on the location index and sorts
+        by distance"""
+        env = {"HBNB_DB_URL": "sqlite:///test_near.db", "HBNB_ENV": ""}
+        with mock.patch.dict(os.environ, env):
+            storage = db_storage.DBStorage()
+            storage.reload()
+        engine = storage._DBStorage__engine
+        try:
+            state = State(name="S")
+            city = City(name="C", state_id=state.id)
+            user = User(email="a", password="b")
+            places = [Place(name=name, city_id=city.id, user_id=user.id,
+                            latitude=lat, longitude=lng)
+                      for name, lat, lng in (("fiji", -17.7, 179.99),
+                                             ("samoa", -17.7, -179.99),
+                                             ("paris", 48.8566, 2.3522))]
+            storage.bulk_new([state, city, user] + places)
+            found = storage.places_near(-17.7, 179.98, 10)
+            self.assertEqual([p.name for p, km in found], ["fiji", "samoa"])
+            found = storage.places_near(48, 2, box=(48, 2, 49, 3), limit=1)
+            self.assertEqual([p.name for p, km in found], ["paris"])
+            self.assertAlmostEqual(found[0][1], 98.7, 1)
+        finally:
+            storage.close()
+            engine.dispose()
+            if os.path.exists("test_near.db"):
+                os.remove("test_near.db")
@@ -18,6 +18,11 @@ from models.user import User
 import json
 import os
 import pep8
+import subprocess
+import sys
+import threading
+import time
+from tests.fixtures import FileStorageTestCase
 import unittest
 
 FileStorage = file_storage.FileStorage
@@ -74,11 +79,14 @@ class TestFileStorage(unittest.TestCase):
     """Test the FileStorage class"""
     @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
     def test_all_returns_dict(self):
-        """Test that all returns the FileStorage.__objects attr"""
+        """Test that all returns a copy of the FileStorage.__objects attr"""
         storage = FileStorage()
         new_dict = storage.all()
         self.assertEqual(type(new_dict), dict)
-        self.assertIs(new_dict, storage._FileStorage__objects)
+        self.assertEqual(new_dict, storage._FileStorage__objects)
+        self.assertIsNot(new_dict, storage._FileStorage__objects)
+        new_dict["State.nope"] = State()
+        self.assertNotIn("State.nope", storage.all())
 
     @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
     def test_new(self):
@@ -144,3 +152,623 @@ class TestFileStorage(unittest.TestCase):
         """Test count when cls is passed"""
         objs = len(storage.all(State).values())
         self.assertEqual(storage.count(State), objs)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_all_cls_uses_class_index(self):
+        """Test that all(cls) returns only the objects of that class"""
+        storage = FileStorage()
+        state = State()
+        city = City()
+        storage.new(state)
+        storage.new(city)
+        states = storage.all(State)
+        self.assertIn("State." + state.id, states)
+        self.assertNotIn("City." + city.id, states)
+        self.assertEqual(states, storage.all("State"))
+        storage.delete(state)
+        storage.delete(city)
+        self.assertNotIn("State." + state.id, storage.all(State))
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_related(self):
+        """Test that related reads the foreign key index"""
+        storage = FileStorage()
+        state = State()
+        city = City(state_id=state.id)
+        storage.new(state)
+        storage.new(city)
+        self.assertEqual(storage.related(City, "state_id", state.id),
+                         {"City." + city.id: city})
+        self.assertEqual(state.cities, [city])
+        city.state_id = "moved"
+        storage.new(city)
+        self.assertEqual(state.cities, [])
+        self.assertIn("City." + city.id,
+                      storage.related(City, "state_id", "moved"))
+        storage.delete(city)
+        storage.delete(state)
+        self.assertEqual(storage.related(City, "state_id", "moved"), {})
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_indexes_follow_replaced_objects(self):
+        """Test that the indexes are rebuilt when __objects is replaced"""
+        storage = FileStorage()
+        save = FileStorage._FileStorage__objects
+        review = Review(place_id="1234")
+        FileStorage._FileStorage__objects = {"Review." + review.id: review}
+        self.assertEqual(storage.count(Review), 1)
+        self.assertEqual(storage.get(Review, review.id), review)
+        self.assertEqual(len(storage.related(Review, "place_id", "1234")), 1)
+        FileStorage._FileStorage__objects = save
+        self.assertIsNone(storage.get(Review, review.id))
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_dirty_tracks_setattr(self):
+        """Test that setting an attribute on a stored object marks it
+        dirty and that save() writes the change"""
+        storage = FileStorage()
+        state = State(name="Before")
+        self.assertNotIn("State." + state.id, storage.dirty())
+        storage.new(state)
+        storage.save()
+        self.assertEqual(storage.dirty(), set())
+        state.name = "After"
+        self.assertEqual(storage.dirty(), {"State." + state.id})
+        storage.save()
+        self.assertEqual(storage.dirty(), set())
+        with open("file.json", "r") as f:
+            js = json.load(f)
+        self.assertEqual(js["State." + state.id]["name"], "After")
+        storage.delete(state)
+        storage.save()
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_mark_moves_foreign_key(self):
+        """Test that changing a foreign key updates the index"""
+        storage = FileStorage()
+        review = Review(place_id="old")
+        storage.new(review)
+        review.place_id = "new"
+        self.assertEqual(storage.related(Review, "place_id", "old"), {})
+        self.assertIn("Review." + review.id,
+                      storage.related(Review, "place_id", "new"))
+        storage.delete(review)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_page_related(self):
+        """Test that page can be restricted to one foreign key value"""
+        storage = FileStorage()
+        reviews = [Review(place_id="p1") for i in range(3)]
+        other = Review(place_id="p2")
+        for review in reviews + [other]:
+            storage.new(review)
+        ids = sorted(review.id for review in reviews)
+        page = storage.page(Review, 2, ids[0], "place_id", "p1")
+        self.assertEqual([obj.id for obj in page.values()], ids[1:])
+        for review in reviews + [other]:
+            storage.delete(review)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_close_reloads_only_changes(self):
+        """Test that close() keeps the objects when the file is unchanged
+        and picks up the objects written by someone else"""
+        storage = FileStorage()
+        state = State(name="Mine")
+        storage.new(state)
+        storage.save()
+        storage.close()
+        self.assertIs(storage.get(State, state.id), state)
+        other = State(name="Theirs")
+        with open("file.json", "r") as f:
+            js = json.load(f)
+        js["State." + other.id] = other.to_dict()
+        with open("file.json", "w") as f:
+            json.dump(js, f)
+        storage.close()
+        self.assertEqual(storage.get(State, other.id).name, "Theirs")
+        storage.delete(storage.get(State, other.id))
+        storage.delete(storage.get(State, state.id))
+        storage.save()
+
+
+@unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+class TestFileStorageModes(FileStorageTestCase):
+    """Tests of the storage modes and indexes, each run on a FileStorage
+    of its own inside a temporary directory"""
+
+    def test_journal_save_and_reload(self):
+        """Test that journal mode appends changes and replays them"""
+        storage = FileStorage()
+        FileStorage._FileStorage__journal = True
+        kept = State(name="Kept")
+        gone = State(name="Gone")
+        storage.new(kept)
+        storage.new(gone)
+        storage.save()
+        storage.delete(gone)
+        storage.save()
+        self.assertFalse(os.path.exists("file.json"))
+        with open("file.json.journal", "r") as f:
+            self.assertEqual(len(f.readlines()), 3)
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(storage.get(State, kept.id).name, "Kept")
+        self.assertIsNone(storage.get(State, gone.id))
+        storage.compact()
+        self.assertFalse(os.path.exists("file.json.journal"))
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(list(storage.all(State)), ["State." + kept.id])
+        loaded = storage.get(State, kept.id)
+        storage.close()
+        self.assertIs(storage.get(State, kept.id), loaded)
+        other = State(name="Other")
+        with open("file.json.journal", "a") as f:
+            f.write(json.dumps({"key": "State." + other.id,
+                                "value": other.to_dict()}) + "\n")
+        storage.close()
+        self.assertEqual(storage.get(State, other.id).name, "Other")
+
+    def test_lazy_reload(self):
+        """Test that lazy mode builds the objects when first returned"""
+        storage = FileStorage()
+        FileStorage._FileStorage__lazy = True
+        state = State(name="California")
+        cities = [City(name=str(i), state_id=state.id) for i in range(3)]
+        other = City(name="Elsewhere", state_id="other")
+        for obj in [state, other] + cities:
+            storage.new(obj)
+        storage.save()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        objects = FileStorage._FileStorage__objects
+        self.assertEqual(len(objects), 0)
+        self.assertEqual(storage.count(), 5)
+        self.assertEqual(storage.count(City), 4)
+        self.assertEqual(storage.get(State, state.id).name, "California")
+        self.assertEqual(list(objects), ["State." + state.id])
+        self.assertEqual(len(storage.related(City, "state_id",
+                                             state.id)), 3)
+        self.assertNotIn("City." + other.id, objects)
+        self.assertEqual(list(storage.page(City, 2)),
+                         ["City." + c.id for c in
+                          sorted(cities + [other],
+                                 key=lambda c: c.id)][:2])
+        storage.save()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(storage.all(City)["City." + other.id].name,
+                         "Elsewhere")
+        self.assertEqual(len(storage.all()), 5)
+        self.assertEqual(storage.dirty(), set())
+
+    def test_lazy_page_journal(self):
+        """Test that page() by foreign key sees the objects another
+        process appended to the journal in lazy mode"""
+        storage = FileStorage()
+        FileStorage._FileStorage__lazy = True
+        FileStorage._FileStorage__journal = True
+        state = State(name="California")
+        storage.new(state)
+        storage.new(City(name="First", state_id=state.id))
+        storage.save()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(len(storage.page(City, 10, None, "state_id",
+                                          state.id)), 1)
+        city = City(name="Second", state_id=state.id)
+        with open("file.json.journal", "a") as f:
+            f.write(json.dumps({"key": "City." + city.id,
+                                "value": city.to_dict()}) + "\n")
+        storage.close()
+        self.assertEqual(len(storage.page(City, 10, None, "state_id",
+                                          state.id)), 2)
+        with open("file.json.journal", "a") as f:
+            f.write(json.dumps({"key": "City." + city.id,
+                                "deleted": True}) + "\n")
+        storage.close()
+        self.assertEqual(len(storage.page(City, 10, None, "state_id",
+                                          state.id)), 1)
+
+    def test_sharded_save_and_migrate(self):
+        """Test that the sharded layout writes only the changed classes
+        and that migrate() converts between the layouts"""
+        storage = FileStorage()
+        FileStorage._FileStorage__sharded = True
+        state = State(name="California")
+        amenity = Amenity(name="Wifi")
+        storage.new(state)
+        storage.new(amenity)
+        storage.save()
+        self.assertFalse(os.path.exists("file.json"))
+        with open("file.State.json", "r") as f:
+            self.assertEqual(list(json.load(f)), ["State." + state.id])
+        mtime = os.stat("file.State.json").st_mtime_ns
+        amenity.name = "Pool"
+        storage.save()
+        self.assertEqual(os.stat("file.State.json").st_mtime_ns,
+                         mtime)
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(storage.get(Amenity, amenity.id).name, "Pool")
+        storage.migrate(False)
+        self.assertFalse(os.path.exists("file.State.json"))
+        with open("file.json", "r") as f:
+            self.assertEqual(set(json.load(f)),
+                             {"State." + state.id,
+                              "Amenity." + amenity.id})
+        storage.migrate(True)
+        self.assertFalse(os.path.exists("file.json"))
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(storage.get(State, state.id).name, "California")
+
+    def test_binary_format(self):
+        """Test that the binary format round-trips to_dict(), journal
+        included, and that migrate() converts the JSON file to it"""
+        storage = FileStorage()
+        FileStorage._FileStorage__journal = True
+        place = Place(name="Loft", latitude=37.77, number_rooms=3,
+                      amenity_ids=["a", "b"])
+        storage.new(place)
+        storage.compact()
+        storage.migrate(fmt="binary")
+        self.assertFalse(os.path.exists("file.json"))
+        with open("file.bin", "rb") as f:
+            self.assertTrue(f.read().startswith(b"HBNB"))
+        user = User(email="a@b.c", password="pwd")
+        storage.new(user)
+        storage.save()
+        self.assertTrue(os.path.exists("file.bin.journal"))
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(storage.get(Place, place.id).to_dict(),
+                         place.to_dict())
+        self.assertEqual(storage.get(User, user.id).to_dict(),
+                         user.to_dict())
+        storage.compact()
+        self.assertFalse(os.path.exists("file.bin.journal"))
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(storage.count(), 2)
+
+    def test_mapped_reload(self):
+        """Test that the mapped mode reads the offset index and decodes
+        only the records of the objects used"""
+        storage = FileStorage()
+        FileStorage._FileStorage__mapped = True
+        state = State(name="Texas")
+        city = City(name="Austin", state_id=state.id)
+        storage.new(state)
+        storage.new(city)
+        storage.save()
+        with open("file.json.idx", "r") as f:
+            records = json.load(f)["records"]
+        with open("file.json", "rb") as f:
+            offset, length = records["City." + city.id]
+            f.seek(offset)
+            self.assertTrue(f.read(length).startswith(
+                json.dumps("City." + city.id).encode()))
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        objects = FileStorage._FileStorage__objects
+        self.assertEqual(len(objects), 0)
+        self.assertEqual(storage.count(), 2)
+        self.assertEqual(storage.get(State, state.id).name, "Texas")
+        self.assertEqual(len(objects), 1)
+        self.assertEqual(list(storage.related(City, "state_id",
+                                              state.id)),
+                         ["City." + city.id])
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        storage.new(Amenity(name="Wifi"))
+        storage.save()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(storage.get(City, city.id).to_dict(),
+                         city.to_dict())
+        self.assertEqual(storage.count(), 3)
+
+    def test_group_commit(self):
+        """Test that save() calls made within the group commit window are
+        written once, and that the files are replaced, never truncated"""
+        storage = FileStorage()
+        FileStorage._FileStorage__window = 0.1
+        commits = []
+        original = FileStorage._FileStorage__commit
+
+        def commit(self):
+            commits.append(1)
+            original(self)
+        FileStorage._FileStorage__commit = commit
+        self.addCleanup(setattr, FileStorage, "_FileStorage__commit",
+                        original)
+        users = [User(email=str(i)) for i in range(5)]
+        threads = []
+        for user in users:
+            storage.new(user)
+            threads.append(threading.Thread(target=storage.save))
+            threads[-1].start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(commits), 1)
+        with open("file.json", "r") as f:
+            self.assertEqual(len(json.load(f)), 5)
+        self.assertFalse([name for name in os.listdir(".")
+                          if name.startswith("file.json.")])
+        with open("file.json", "w") as f:
+            f.write('{"User.1": {"id"')
+        with self.assertRaises(ValueError):
+            storage.reload()
+
+    def test_shared_processes(self):
+        """Test that processes sharing the files lose none of each other's
+        saves, and that close() picks up what another process committed"""
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__)))))
+        script = ("from models.state import State\n"
+                  "for i in range(20):\n"
+                  "    State(name='{}-' + str(i)).save()\n")
+        env = {k: v for k, v in os.environ.items()
+               if not k.startswith("HBNB_FILE_") and
+               k != "HBNB_TYPE_STORAGE"}
+        env.update(HBNB_FILE_SHARED="1", PYTHONPATH=root)
+        storage = FileStorage()
+        FileStorage._FileStorage__shared = True
+        storage.reload()
+        children = [subprocess.Popen([sys.executable, "-c",
+                                      script.format(n)],
+                                     cwd=self.tmp, env=env)
+                    for n in range(4)]
+        for child in children:
+            self.assertEqual(child.wait(), 0)
+        with open("file.json", "r") as f:
+            self.assertEqual(len(json.load(f)), 80)
+        self.assertEqual(storage.count(State), 0)
+        storage.close()
+        self.assertEqual(storage.count(State), 80)
+        state = list(storage.all(State).values())[0]
+        state.name = "mine"
+        storage.new(State(name="new"))
+        storage.save()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(storage.count(State), 81)
+        self.assertEqual(storage.get(State, state.id).name, "mine")
+
+    def test_write_behind(self):
+        """Test that save() leaves the write to the flusher thread, which
+        writes after the delay or once enough objects are dirty"""
+        storage = FileStorage()
+        FileStorage._FileStorage__behind = 0.2
+        FileStorage._FileStorage__behind_max = 3
+        flushes = storage.metrics()["flushes"]
+        storage.new(State(name="Ohio"))
+        storage.save()
+        self.assertFalse(os.path.exists("file.json"))
+        metrics = storage.metrics()
+        self.assertTrue(metrics["write_behind"])
+        self.assertEqual(metrics["pending_objects"], 1)
+        self.assertGreaterEqual(metrics["loss_window_seconds"], 0.2)
+        for i in range(100):
+            if storage.metrics()["flushes"] > flushes:
+                break
+            time.sleep(0.01)
+        self.assertTrue(os.path.exists("file.json"))
+        self.assertEqual(storage.metrics()["pending_objects"], 0)
+        storage.new(State(name="Utah"))
+        storage.save()
+        for i in range(100):
+            if storage.metrics()["flushes"] > flushes + 1:
+                break
+            time.sleep(0.01)
+        with open("file.json", "r") as f:
+            self.assertEqual(len(json.load(f)), 2)
+        self.assertLess(storage.metrics()["max_unflushed_seconds"], 1)
+        FileStorage._FileStorage__behind = 60
+        for i in range(3):
+            storage.new(State(name=str(i)))
+        storage.save()
+        for i in range(100):
+            if storage.metrics()["flushes"] > flushes + 2:
+                break
+            time.sleep(0.01)
+        with open("file.json", "r") as f:
+            self.assertEqual(len(json.load(f)), 5)
+        storage.new(State(name="last"))
+        storage.save()
+        storage.flush()
+        self.assertEqual(storage.metrics()["unflushed_seconds"], 0)
+        with open("file.json", "r") as f:
+            self.assertEqual(len(json.load(f)), 6)
+        FileStorage._FileStorage__behind = 60
+        state = storage.get(State, next(iter(
+            storage.all(State).values())).id)
+        state.name = "local-change"
+        storage.save()
+        with open("file.json", "r") as f:
+            objs = json.load(f)
+        objs["State.other"] = dict(next(iter(objs.values())),
+                                   id="other")
+        time.sleep(0.01)
+        with open("file.json", "w") as f:
+            json.dump(objs, f)
+        storage.close()
+        self.assertEqual(state.name, "local-change")
+        self.assertEqual(storage.count(State), 7)
+        storage.flush()
+        with open("file.json", "r") as f:
+            names = [v["name"] for v in json.load(f).values()]
+        self.assertIn("local-change", names)
+
+    def test_bulk_new_and_update(self):
+        """Test that bulk_new() and bulk_update() write the file once"""
+        storage = FileStorage()
+        commits = []
+        original = FileStorage._FileStorage__commit
+
+        def commit(self):
+            commits.append(1)
+            original(self)
+        FileStorage._FileStorage__commit = commit
+        self.addCleanup(setattr, FileStorage, "_FileStorage__commit",
+                        original)
+        states = [State(name=str(i)) for i in range(50)]
+        storage.bulk_new(states)
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(storage.count(State), 50)
+        created = states[0].created_at
+        rows = [{"id": s.id, "name": "x", "created_at": "no"}
+                for s in states[:10]] + [{"id": "nope", "name": "y"}]
+        self.assertEqual(storage.bulk_update(State, rows), 10)
+        self.assertEqual(len(commits), 2)
+        self.assertEqual(states[0].name, "x")
+        self.assertEqual(states[0].created_at, created)
+        self.assertGreater(states[0].updated_at, created)
+        with open("file.json", "r") as f:
+            names = [v["name"] for v in json.load(f).values()]
+        self.assertEqual(names.count("x"), 10)
+
+    def test_encode_cache(self):
+        """Test that save() keeps the records of the saved objects only
+        when the cache of encoded records is on"""
+        storage = FileStorage()
+        state = State(name="a")
+        storage.new(state)
+        FileStorage._FileStorage__encode_cache = False
+        storage.save()
+        self.assertEqual(FileStorage._FileStorage__encoded, {})
+        FileStorage._FileStorage__encode_cache = True
+        storage.new(State(name="b"))
+        storage.save()
+        self.assertIn("State." + state.id, FileStorage._FileStorage__encoded)
+        state.name = "c"
+        storage.save()
+        with open("file.json", "r") as f:
+            self.assertEqual(json.load(f)["State." + state.id]["name"], "c")
+
+    def test_page(self):
+        """Test that page walks the objects of a class in id order"""
+        storage = FileStorage()
+        amenities = [Amenity() for i in range(5)]
+        for amenity in amenities:
+            storage.new(amenity)
+        ids = sorted(amenity.id for amenity in amenities)
+        first = storage.page(Amenity, 3)
+        self.assertEqual([obj.id for obj in first.values()], ids[:3])
+        rest = storage.page(Amenity, 3, ids[2])
+        self.assertEqual([obj.id for obj in rest.values()], ids[3:])
+        storage.delete(storage.get(Amenity, ids[3]))
+        extra = Amenity()
+        storage.new(extra)
+        rest = storage.page(Amenity, 10, ids[2])
+        expected = sorted(i for i in [ids[4], extra.id] if i > ids[2])
+        self.assertEqual([obj.id for obj in rest.values()], expected)
+
+    def test_all_where_order_by_limit(self):
+        """Test that all() filters, sorts and limits the objects"""
+        storage = FileStorage()
+        places = [Place(city_id=str(i % 2), name="p" + str(i % 3),
+                        number_rooms=i) for i in range(6)]
+        for place in places:
+            storage.new(place)
+        storage.new(State(name="p1"))
+        objs = storage.all(Place, where={"city_id": "1"})
+        self.assertEqual(sorted(o.number_rooms for o in objs.values()),
+                         [1, 3, 5])
+        objs = storage.all(Place, where={"city_id": "1", "name": "p2"})
+        self.assertEqual([o.number_rooms for o in objs.values()], [5])
+        objs = storage.all(Place, order_by=["-name", "number_rooms"],
+                           limit=4)
+        self.assertEqual([o.number_rooms for o in objs.values()],
+                         [2, 5, 1, 4])
+        ids = sorted(p.id for p in places)[:2]
+        self.assertEqual([o.id for o in storage.all(Place, limit=2)
+                          .values()], ids)
+        self.assertEqual(len(storage.all(where={"name": "p1"})), 3)
+        with self.assertRaises(ValueError):
+            storage.all(order_by="name")
+
+    def test_page_where(self):
+        """Test that page keeps the objects matching where and follows the
+        changes made between two pages"""
+        storage = FileStorage()
+        places = [Place(city_id="c", name="p" + str(i % 2))
+                  for i in range(6)]
+        for place in places:
+            storage.new(place)
+        ids = sorted(p.id for p in places if p.name == "p0")
+        where = {"name": "p0"}
+        page = storage.page(Place, 2, None, "city_id", "c", where)
+        self.assertEqual(list(o.id for o in page.values()), ids[:2])
+        page = storage.page(Place, 2, ids[1], "city_id", "c", where)
+        self.assertEqual(list(o.id for o in page.values()), ids[2:])
+        storage.get(Place, ids[2]).name = "p1"
+        extra = Place(city_id="c", name="p0")
+        storage.new(extra)
+        storage.delete(storage.get(Place, ids[0]))
+        page = storage.page(Place, 10, None, "city_id", "c", where)
+        self.assertEqual(list(o.id for o in page.values()),
+                         sorted([ids[1], extra.id]))
+        self.assertEqual(storage.page(Place, 10, None, "city_id", "d",
+                                      where), {})
+
+    def test_search_places(self):
+        """Test that search_places() follows the state, city and amenity
+        indexes as the objects change"""
+        storage = FileStorage()
+        state = State(name="A")
+        cities = [City(state_id=state.id), City(state_id="other")]
+        places = [Place(city_id=cities[i % 2].id) for i in range(4)]
+        for obj in [state] + cities + places:
+            storage.new(obj)
+        places[0].amenity_ids = ["wifi", "pool"]
+        places[1].amenity_ids = ["wifi"]
+
+        def search(**filters):
+            return [o.id for o in storage.search_places(**filters)
+                    .values()]
+        self.assertEqual(search(), sorted(p.id for p in places))
+        self.assertEqual(search(states=[state.id]),
+                         sorted([places[0].id, places[2].id]))
+        self.assertEqual(search(amenities=["wifi"]),
+                         sorted([places[0].id, places[1].id]))
+        self.assertEqual(search(states=[state.id],
+                                cities=[cities[1].id],
+                                amenities=["wifi", "pool"]),
+                         [places[0].id])
+        places[0].amenity_ids = ["pool"]
+        places[2].amenity_ids = places[2].amenity_ids + ["wifi"]
+        cities[1].state_id = state.id
+        self.assertEqual(search(states=[state.id], amenities=["wifi"]),
+                         sorted([places[1].id, places[2].id]))
+
+    def test_places_near(self):
+        """Test that places_near() finds the places by location through
+        the grid index, as they move"""
+        storage = FileStorage()
+        paris = Place(name="paris", latitude=48.8566, longitude=2.3522)
+        versailles = Place(name="versailles", latitude=48.8049,
+                           longitude=2.1204)
+        fiji = Place(name="fiji", latitude=-17.7, longitude=179.99)
+        samoa = Place(name="samoa", latitude=-17.7, longitude=-179.99)
+        for place in (paris, versailles, fiji, samoa):
+            storage.new(place)
+
+        def near(*args, **kwargs):
+            return [(p.name, round(km)) for p, km in
+                    storage.places_near(*args, **kwargs)]
+        self.assertEqual(near(48.86, 2.35, 25),
+                         [("paris", 0), ("versailles", 18)])
+        self.assertEqual(near(48.86, 2.35, 25, limit=1), [("paris", 0)])
+        self.assertEqual(near(48.86, 2.35, box=(48.8, 2.0, 48.82, 2.2)),
+                         [("versailles", 18)])
+        self.assertEqual([p for p, km in near(-17.7, 179.99, 5)],
+                         ["fiji", "samoa"])
+        self.assertEqual(near(-17.7, -179.9, box=(-18, 179, -17, -179)),
+                         [("samoa", 10), ("fiji", 12)])
+        versailles.latitude, versailles.longitude = -17.7, 179.98
+        self.assertEqual(near(48.86, 2.35, 25), [("paris", 0)])
+        self.assertEqual(len(near(-17.7, 179.99, 5)), 3)
+        with self.assertRaises(ValueError):
+            storage.places_near(0, 0)
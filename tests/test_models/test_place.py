@@ -198,3 +198,17 @@ class TestPlace(unittest.TestCase):
         place = Place()
         string = "[Place] ({}) {}".format(place.id, place.__dict__)
         self.assertEqual(string, str(place))
+
+    @unittest.skipIf(not models.base_model.compact, "not testing compact")
+    def test_compact_layout(self):
+        """Test that compact places use slots, do not share amenity_ids
+        and still accept extra attributes"""
+        place1 = Place()
+        place2 = Place()
+        self.assertIn("amenity_ids", Place._fields)
+        place1.amenity_ids.append("1234")
+        self.assertEqual(place2.amenity_ids, [])
+        place1.pets = "allowed"
+        self.assertEqual(place1.pets, "allowed")
+        self.assertEqual(place1.to_dict()["pets"], "allowed")
+        self.assertFalse(hasattr(place2, "pets"))
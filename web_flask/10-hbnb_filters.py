@@ -12,7 +12,7 @@ app = Flask(__name__)
 @app.route('/hbnb_filters', strict_slashes=False)
 def filters():
     """display a HTML page like 6-index.html from static"""
-    states = storage.all("State").values()
+    states = storage.all("State", eager=["cities"]).values()
     amenities = storage.all("Amenity").values()
     return render_template('10-hbnb_filters.html', states=states,
                            amenities=amenities)
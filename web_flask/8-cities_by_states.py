@@ -12,7 +12,7 @@ app = Flask(__name__)
 @app.route('/cities_by_states', strict_slashes=False)
 def cities_by_states():
     """display the states and cities listed in alphabetical order"""
-    states = storage.all("State").values()
+    states = storage.all("State", eager=["cities"]).values()
     return render_template('8-cities_by_states.html', states=states)
 
 